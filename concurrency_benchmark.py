@@ -0,0 +1,96 @@
+"""
+Latences melangees lecture / ingestion sous charge, pour verifier que le travail SQL
+synchrone ne bloque pas la boucle d'evenements.
+
+Trois familles de clients tournent en parallele contre un serveur deja lance:
+- des lecteurs lents qui enchainent /data/energy-report sur une large periode,
+- des cartes qui postent une lecture sur /data a intervalle fixe,
+- des sondes sur /control/get-commands, qui ne touche pas la base: si sa latence suit
+  celle des rapports, la boucle d'evenements est bloquee par une requete SQL.
+Le script affiche pour chaque famille le nombre de requetes, les erreurs et les
+latences p50/p95/max. Lancer le meme scenario avant et apres un changement pour comparer.
+
+Usage: python concurrency_benchmark.py --url http://localhost:8000 --duration 30 [--readers 4] [--boards 20]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from ingest_benchmark import esp32_reading
+
+
+async def client_loop(client: httpx.AsyncClient, request, interval: float, deadline: float, stats: dict):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await request(client)
+            if response.status_code >= 400:
+                stats["errors"] += 1
+        except httpx.HTTPError:
+            stats["errors"] += 1
+        stats["latencies"].append(time.perf_counter() - started)
+        if interval:
+            await asyncio.sleep(interval)
+
+
+def print_stats(label: str, stats: dict) -> None:
+    latencies = sorted(stats["latencies"]) or [0.0]
+    print(
+        f"{label:<28} {len(stats['latencies']):6d} requetes  {stats['errors']:4d} erreurs  "
+        f"p50 {statistics.median(latencies) * 1000:8.1f} ms  "
+        f"p95 {latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000:8.1f} ms  "
+        f"max {latencies[-1] * 1000:8.1f} ms"
+    )
+
+
+async def run(args) -> None:
+    end = datetime.utcnow()
+    report_params = {"start_date": (end - timedelta(days=args.report_days)).isoformat(), "end_date": end.isoformat()}
+    counter = iter(range(10 ** 9))
+
+    def post_reading(client):
+        reading = esp32_reading(next(counter))
+        return client.post("/data", json=reading)
+
+    families = {
+        f"/data/energy-report ({args.report_days} j)": (args.readers, 0, lambda client: client.get("/data/energy-report", params=report_params)),
+        "/data (ingestion)": (args.boards, args.board_interval, post_reading),
+        "/control/get-commands (sonde)": (args.probes, args.probe_interval,
+                                          lambda client: client.get("/control/get-commands", params={"board": "benchmark"})),
+    }
+    results = {label: {"latencies": [], "errors": 0} for label in families}
+
+    limits = httpx.Limits(max_connections=sum(count for count, _, _ in families.values()))
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=120) as client:
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(*[
+            client_loop(client, request, interval, deadline, results[label])
+            for label, (count, interval, request) in families.items()
+            for _ in range(count)
+        ])
+
+    for label, stats in results.items():
+        print_stats(label, stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latences lecture / ingestion sous charge")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--report-days", type=int, default=30)
+    parser.add_argument("--boards", type=int, default=20)
+    parser.add_argument("--board-interval", type=float, default=1.0)
+    parser.add_argument("--probes", type=int, default=5)
+    parser.add_argument("--probe-interval", type=float, default=0.1)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Rendu du graphique de prevision Solcast, execute dans les processus du pool de rendu.
+
+Ce module n'a aucun effet de bord a l'import (pas de base de donnees, pas de logging):
+il peut etre charge par les workers du ProcessPoolExecutor de main.py.
+Seule l'API objet de matplotlib (Figure) est utilisee, jamais l'etat global de pyplot.
+"""
+import io
+import time
+
+
+def init_renderer():
+    """Initialiseur des workers: importer matplotlib et pandas une seule fois par processus"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.figure
+    import matplotlib.dates
+    import matplotlib.backends.backend_agg
+    import pandas
+    import PIL.Image
+
+
+def warm_up():
+    """Tache vide soumise au demarrage pour lancer les workers avant la premiere requete"""
+    return True
+
+
+def make_thumbnail(png: bytes, width: int, image_format: str) -> tuple:
+    """
+    Reduire une image PNG a la largeur donnee (format 'webp' ou 'png').
+    Retourne (bytes, media_type); repli sur PNG si Pillow n'a pas le support WebP.
+    """
+    from PIL import Image, features
+
+    if image_format == 'webp' and not features.check('webp'):
+        image_format = 'png'
+
+    image = Image.open(io.BytesIO(png))
+    height = max(1, round(image.height * width / image.width))
+    thumbnail = image.convert('RGB').resize((width, height), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    if image_format == 'webp':
+        thumbnail.save(buffer, format='WEBP', quality=80, method=4)
+    else:
+        thumbnail.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue(), f"image/{image_format}"
+
+
+def render_forecast(forecasts: list, thumbnail_width: int = 480, thumbnail_format: str = 'webp') -> dict:
+    """
+    Construire le graphique PNG a partir de la liste 'forecasts' de la reponse Solcast.
+    Retourne {"png": bytes, "thumbnail": bytes, "thumbnail_media_type": str,
+    "data_points": int, "timings": {"parse_ms", "render_ms", "encode_ms", "thumbnail_ms"}}.
+    """
+    import pandas as pd
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.dates import DateFormatter, HourLocator
+    from PIL import Image
+
+    started = time.perf_counter()
+
+    # Traitement des données
+    df_forecasts = pd.DataFrame(forecasts)
+    df_forecasts['period_end'] = pd.to_datetime(df_forecasts['period_end'])
+
+    # Conversion en kW
+    for col in ['pv_estimate', 'pv_estimate10', 'pv_estimate90']:
+        df_forecasts[col] = df_forecasts[col] / 1000
+
+    df_forecasts.rename(columns={
+        'pv_estimate': 'forecast_median_kw',
+        'pv_estimate10': 'forecast_pessimistic_kw',
+        'pv_estimate90': 'forecast_optimistic_kw'
+    }, inplace=True)
+
+    parsed = time.perf_counter()
+
+    # Génération du graphique
+    fig = Figure(figsize=(16, 8), dpi=150)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.subplots()
+
+    # Plage de confiance
+    ax.fill_between(df_forecasts['period_end'],
+                    df_forecasts['forecast_pessimistic_kw'],
+                    df_forecasts['forecast_optimistic_kw'],
+                    color='orange',
+                    alpha=0.3,
+                    label='Plage de Confiance à 80%')
+
+    # Ligne médiane
+    ax.plot(df_forecasts['period_end'],
+            df_forecasts['forecast_median_kw'],
+            color='red',
+            linestyle='-',
+            linewidth=2,
+            label='Prédiction Médiane')
+
+    # Formatage du graphique
+    ax.set_title('Prévision de Production Solaire', fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel('Date et Heure', fontsize=12)
+    ax.set_ylabel('Puissance AC Prévue (kW)', fontsize=12)
+    ax.grid(True, linestyle='--', alpha=0.7)
+    ax.legend(fontsize=11)
+
+    # Formatage des dates sur l'axe X
+    ax.xaxis.set_major_formatter(DateFormatter('%d/%m %H:%M'))
+    ax.xaxis.set_major_locator(HourLocator(interval=6))
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+        label.set_horizontalalignment('right')
+
+    fig.tight_layout()
+
+    # Rasterisation puis encodage PNG du tampon deja dessine (une seule passe de rendu)
+    canvas.draw()
+
+    rendered = time.perf_counter()
+
+    buffer = io.BytesIO()
+    Image.frombuffer('RGBA', canvas.get_width_height(), canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1).save(
+        buffer, format='PNG', dpi=(150, 150)
+    )
+    png = buffer.getvalue()
+
+    encoded = time.perf_counter()
+
+    thumbnail, thumbnail_media_type = make_thumbnail(png, thumbnail_width, thumbnail_format)
+
+    thumbnailed = time.perf_counter()
+
+    return {
+        "png": png,
+        "thumbnail": thumbnail,
+        "thumbnail_media_type": thumbnail_media_type,
+        "data_points": len(df_forecasts),
+        "timings": {
+            "parse_ms": round((parsed - started) * 1000, 1),
+            "render_ms": round((rendered - parsed) * 1000, 1),
+            "encode_ms": round((encoded - rendered) * 1000, 1),
+            "thumbnail_ms": round((thumbnailed - encoded) * 1000, 1)
+        }
+    }
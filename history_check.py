@@ -0,0 +1,96 @@
+"""
+Verification de la pagination de /data/history (offset et curseur).
+
+Cree la table sensor_readings dans une base SQLite en memoire, y insere des lectures
+synthetiques, puis parcourt l'historique via le client de test FastAPI: premiere page
+sans curseur (comme le tableau de bord), pages suivantes avec X-Next-Cursor, retour
+avec X-Prev-Cursor, et pagination par offset. Les pages doivent se recouper exactement
+avec l'ordre (timestamp, id) decroissant.
+
+Usage: python history_check.py [--rows 250] [--limit 40]
+Code de sortie 1 en cas d'echec.
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import main
+from response_benchmark import synthetic_reading
+
+
+def main_check():
+    parser = argparse.ArgumentParser(description="Pagination de /data/history")
+    parser.add_argument("--rows", type=int, default=250)
+    parser.add_argument("--limit", type=int, default=40)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    main.SensorData.__table__.create(engine)
+    TestingSession = sessionmaker(bind=engine)
+    with TestingSession() as db:
+        # Horodatages en double pour verifier le departage par id
+        db.add_all([
+            main.SensorData(**{**synthetic_reading(i), "id": i + 1,
+                               "timestamp": datetime(2026, 1, 1) + timedelta(seconds=i // 2)})
+            for i in range(args.rows)
+        ])
+        db.commit()
+    expected = list(range(args.rows, 0, -1))
+
+    def override_db():
+        db = TestingSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[main.get_db] = override_db
+    client = TestClient(main.app)
+
+    failures = []
+
+    def check(label, condition):
+        print(f"{'OK   ' if condition else 'ECHEC'} {label}")
+        if not condition:
+            failures.append(label)
+
+    # Premiere page sans curseur (offset implicite a 0)
+    response = client.get("/data/history", params={"limit": args.limit})
+    check("premiere page sans curseur -> 200", response.status_code == 200)
+    ids = [row["id"] for row in response.json()]
+    check("premiere page dans l'ordre decroissant", ids == expected[:args.limit])
+    check("pas de X-Prev-Cursor sur la premiere page", "x-prev-cursor" not in response.headers)
+
+    # Parcours complet par curseur
+    pages = [ids]
+    while "x-next-cursor" in response.headers:
+        response = client.get("/data/history", params={"limit": args.limit, "cursor": response.headers["x-next-cursor"]})
+        if response.status_code != 200:
+            break
+        pages.append([row["id"] for row in response.json()])
+    check("pages suivantes avec curseur -> 200", response.status_code == 200)
+    check("parcours par curseur complet et sans doublon", sum(pages, []) == expected)
+
+    # Retour a la page precedente
+    if len(pages) > 2:
+        response = client.get("/data/history", params={"limit": args.limit, "cursor": client.get(
+            "/data/history", params={"limit": args.limit}).headers["x-next-cursor"]})
+        previous = client.get("/data/history", params={"limit": args.limit, "before": response.headers["x-prev-cursor"]})
+        check("page precedente avec before", [row["id"] for row in previous.json()] == pages[0])
+
+    # Pagination par offset et format colonnes
+    response = client.get("/data/history", params={"limit": args.limit, "offset": args.limit})
+    check("offset -> deuxieme page", response.status_code == 200 and [row["id"] for row in response.json()] == pages[1])
+    response = client.get("/data/history", params={"limit": args.limit, "layout": "columnar"})
+    check("layout=columnar", response.status_code == 200 and response.json()["id"] == pages[0])
+
+    main.app.dependency_overrides.clear()
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main_check()
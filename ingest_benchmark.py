@@ -0,0 +1,72 @@
+"""
+Micro-benchmark du decodage des lectures recues sur /data et /data/batch.
+
+Compare, sur des lectures synthetiques (sans base de donnees), le chemin JSON
+(json.loads puis validation Pydantic de SensorReading et conversion en ligne) et le
+format binaire compact (struct.iter_unpack directement en lignes): temps de decodage
+par lecture et octets transmis par lecture.
+
+Usage: python ingest_benchmark.py [--batch 500] [--repeat 200]
+"""
+import argparse
+import json
+import timeit
+
+import main
+from response_benchmark import synthetic_reading
+
+
+def esp32_reading(i: int) -> dict:
+    reading = synthetic_reading(i)
+    reading["timestamp"] = reading.pop("device_timestamp")
+    return {name: reading[name] for name in main.SensorReading.model_fields}
+
+
+def decode_json_single(body: bytes) -> dict:
+    return main.sensor_reading_to_row(main.SensorReading.model_validate_json(body))
+
+
+def decode_json_batch(body: bytes) -> list:
+    return [main.sensor_reading_to_row(main.SensorReading(**item)) for item in json.loads(body)]
+
+
+def measure(label: str, count: int, json_body: bytes, json_call, binary_body: bytes, binary_call, repeat: int) -> None:
+    json_s = min(timeit.repeat(lambda: json_call(json_body), number=repeat, repeat=3)) / repeat / count
+    binary_s = min(timeit.repeat(lambda: binary_call(binary_body), number=repeat, repeat=3)) / repeat / count
+    print(
+        f"{label:<22} JSON: {json_s * 1e6:7.2f} us/lecture ({len(json_body) / count:5.0f} o)   "
+        f"binaire: {binary_s * 1e6:7.2f} us/lecture ({len(binary_body) / count:5.0f} o)   x{json_s / binary_s:.1f}"
+    )
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Decodage des lectures JSON et binaires")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    # Verification: les deux formats donnent les memes colonnes
+    reading = esp32_reading(1)
+    assert decode_json_single(json.dumps(reading).encode()).keys() == main.decode_sensor_binary(
+        main.encode_sensor_binary([reading]))[0].keys()
+
+    measure(
+        "/data",
+        1,
+        json.dumps(reading).encode(), decode_json_single,
+        main.encode_sensor_binary([reading]), main.decode_sensor_binary,
+        args.repeat * 50
+    )
+
+    readings = [esp32_reading(i) for i in range(args.batch)]
+    measure(
+        f"/data/batch ({args.batch})",
+        args.batch,
+        json.dumps(readings).encode(), decode_json_batch,
+        main.encode_sensor_binary(readings), main.decode_sensor_binary,
+        args.repeat
+    )
+
+
+if __name__ == "__main__":
+    main_benchmark()
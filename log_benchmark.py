@@ -0,0 +1,111 @@
+"""
+Debit de journalisation de POST /data, avant et apres le passage au QueueListener.
+
+"avant": handlers fichier et console appeles dans le thread de la requete et huit lignes
+formatees par lecture (ancien receive_sensor_data). "apres": QueueHandler de main.py,
+ecritures dans le thread du listener et une ligne par lecture (log_sensor_reading).
+Plusieurs threads simulent le pool qui traite les requetes. Le script affiche le debit
+vu par les requetes (temps passe dans les appels de log) et le temps jusqu'a ce que
+tout soit ecrit sur disque.
+
+Usage: python log_benchmark.py [--readings 20000] [--threads 8]
+"""
+import argparse
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import main
+from ingest_benchmark import esp32_reading
+
+
+def old_log_reading(logger: logging.Logger, data, reading_id: int) -> None:
+    logger.info("=== DONNEES RECUES ===")
+    logger.info(f"Timestamp ESP32: {data['timestamp']}")
+    logger.info(f"Source 1 - U1: {data['U1']}V, I1: {data['I1']}A, P1: {data['P1']}W, Etat: {data['etatS1']}")
+    logger.info(f"Source 2 - U2: {data['U2']}V, I2: {data['I2']}A, P2: {data['P2']}W, Etat: {data['etatS2']}")
+    logger.info(f"Lampe 1 - Courant: {data['currentLamp1']}A, Puissance: {data['powerLamp1']}W, Etat: {data['etatLamp1']}")
+    logger.info(f"Lampe 2 - Courant: {data['currentLamp2']}A, Puissance: {data['powerLamp2']}W, Etat: {data['etatLamp2']}")
+    logger.info(f"Energie sauvee - S1: {data['savedEnergyS1']}kWh, S2: {data['savedEnergyS2']}kWh, Total: {data['savedEnergyT']}kWh")
+    logger.info(f"Source active: {data['sourceActive']}, Charge active: {data['chargeActive']}")
+    logger.info(f"Donnees enregistrees avec succes - ID: {reading_id}")
+
+
+def run(label: str, log_call, readings: list, threads: int, flush) -> None:
+    per_thread = len(readings) // threads
+    spent = [0.0] * threads
+
+    def worker(index: int):
+        started = time.perf_counter()
+        for i in range(index * per_thread, (index + 1) * per_thread):
+            log_call(readings[i], i)
+        spent[index] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    returned = time.perf_counter() - started
+    flush()
+    written = time.perf_counter() - started
+
+    total = per_thread * threads
+    print(
+        f"{label:<6} {total / returned:9.0f} lectures/s cote requetes "
+        f"({max(spent) / per_thread * 1e6:6.1f} us/lecture dans le log)   "
+        f"{total / written:9.0f} lectures/s jusqu'a l'ecriture complete"
+    )
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Debit de journalisation des lectures")
+    parser.add_argument("--readings", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    readings = [esp32_reading(i) for i in range(args.readings)]
+    rows = [main.sensor_reading_to_row(main.SensorReading(**reading)) for reading in readings]
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    console = open(os.devnull, "w")
+    logger = logging.getLogger("HybridSystemAPI")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Avant: ecritures synchrones dans le thread de la requete
+        file_handler = logging.FileHandler(os.path.join(tmp, "avant.log"), encoding="utf-8")
+        stream_handler = logging.StreamHandler(console)
+        for handler in (file_handler, stream_handler):
+            handler.setFormatter(formatter)
+        logger.handlers = [file_handler, stream_handler]
+        run("avant", lambda data, i: old_log_reading(logger, data, i), readings, args.threads, file_handler.flush)
+        file_handler.close()
+
+        # Apres: QueueHandler + QueueListener, une ligne par lecture
+        file_handler = RotatingFileHandler(os.path.join(tmp, "apres.log"), maxBytes=main.LOG_MAX_BYTES,
+                                           backupCount=main.LOG_BACKUP_COUNT, encoding="utf-8")
+        stream_handler = logging.StreamHandler(console)
+        for handler in (file_handler, stream_handler):
+            handler.setFormatter(formatter)
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.setFormatter(logging.Formatter('%(message)s'))
+        listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+        logger.handlers = [queue_handler]
+        listener.start()
+        run("apres", lambda row, i: main.log_sensor_reading(row, i), rows, args.threads, listener.stop)
+        file_handler.close()
+
+        for name in ("avant.log", "apres.log"):
+            print(f"{name}: {os.path.getsize(os.path.join(tmp, name)) / args.readings:.0f} o/lecture")
+    console.close()
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -1,28 +1,45 @@
 from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, Boolean
+from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, Boolean, LargeBinary, insert, update, select, func, case, and_, or_, tuple_, Index, extract, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from pydantic import BaseModel
+from sqlalchemy.orm import sessionmaker, Session, aliased
+from pydantic import BaseModel, ValidationError
+from fastapi.exceptions import RequestValidationError
 from datetime import datetime, timedelta
 import os
+import sys
 import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import queue
+import atexit
+import itertools
 import json
+import orjson
+import csv
+import time
+import asyncio
+import threading
+import anyio
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from typing import List, Optional
+from collections import deque
+from types import SimpleNamespace
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import matplotlib
-matplotlib.use('Agg')  
-import matplotlib.pyplot as plt
-import pandas as pd
-import requests
+from starlette.concurrency import run_in_threadpool
 import base64
+import hashlib
 import io
-from matplotlib.dates import DateFormatter
-import matplotlib.dates as mdates
+import struct
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import forecast_render
 
 load_dotenv()
 
@@ -30,15 +47,32 @@ load_dotenv()
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_FILE = os.getenv("LOG_FILE", "hybrid_system.log")
 
-# Configuration du logger
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Journaliser une lecture recue sur N (1 = toutes)
+LOG_READING_SAMPLE_EVERY = max(1, int(os.getenv("LOG_READING_SAMPLE_EVERY", "1")))
+
+# Configuration du logger: les requetes deposent les enregistrements dans une file,
+# un thread (QueueListener) se charge des ecritures fichier (avec rotation) et console
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+log_stream_handler = logging.StreamHandler()
+for _handler in (log_file_handler, log_stream_handler):
+    _handler.setFormatter(log_formatter)
+
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, log_file_handler, log_stream_handler, respect_handler_level=True)
+
+# Le QueueHandler ne fait que fusionner message et arguments: le prefixe
+# (horodatage, logger, niveau) est ajoute une seule fois par les handlers du listener
+log_queue_handler = QueueHandler(log_queue)
+log_queue_handler.setFormatter(logging.Formatter('%(message)s'))
 logging.basicConfig(
     level=getattr(logging, LOG_LEVEL.upper()),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()  
-    ]
+    handlers=[log_queue_handler]
 )
+log_listener.start()
+atexit.register(log_listener.stop)
 
 logger = logging.getLogger("HybridSystemAPI")
 
@@ -56,25 +90,35 @@ logger.info(f"Demarrage de l'API Systeme Hybride")
 logger.info(f"Configuration BDD - Host: {DB_HOST}, Port: {DB_PORT}, DB: {DB_NAME}, User: {DB_USER}")
 logger.info(f"Niveau de log: {LOG_LEVEL}, Fichier de log: {LOG_FILE}")
 
-engine = create_engine(DATABASE_URL)
+# Dimensionnement du pool de connexions et du pool de threads qui execute les requetes SQL
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_THREADPOOL_SIZE = int(os.getenv("DB_THREADPOOL_SIZE", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+
+engine = create_engine(DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-# Test de connexion a  la base de donnees
-try:
-    # Test simple de connexion
-    with engine.connect() as conn:
-        logger.info("Connexion a  la base de donnees reussie")
-except Exception as e:
-    logger.error(f"Erreur de connexion a  la base de donnees: {str(e)}")
-    raise
+# Partitionnement natif de sensor_readings par plage de timestamp: none, day ou month.
+# S'applique a la creation de la table; la retention supprime alors des partitions entieres.
+SENSOR_PARTITION_BY = os.getenv("SENSOR_PARTITION_BY", "none").lower()
+SENSOR_PARTITIONED = SENSOR_PARTITION_BY in ("day", "month")
 
 # Modele de base de donnees
 class SensorData(Base):
     __tablename__ = "sensor_readings"
+    __table_args__ = (
+        # Cle de pagination par curseur de /data/history, derniere lecture, plages de dates
+        Index("ix_sensor_readings_timestamp_id", "timestamp", "id"),
+        # Index compact pour les balayages de longues plages (table alimentee en ordre chronologique)
+        Index("ix_sensor_readings_timestamp_brin", "timestamp", postgresql_using="brin",
+              postgresql_with={"pages_per_range": 32}),
+        Index("ix_sensor_readings_device_timestamp", "device_timestamp"),
+    ) + (({"postgresql_partition_by": "RANGE (timestamp)"},) if SENSOR_PARTITIONED else ())
     
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    # Une table partitionnee exige la cle de partition dans la cle primaire
+    timestamp = Column(DateTime, default=datetime.utcnow, primary_key=SENSOR_PARTITIONED)
     device_timestamp = Column(Integer)  
     
     # Donnees de tension et courant
@@ -104,6 +148,10 @@ class SensorData(Base):
     sourceActive = Column(String)
     chargeActive = Column(String)
     
+# Index partiels: periodes ou une source ou une lampe est active (petits, une minorite de lignes)
+for _name in ("etatS1", "etatS2", "etatLamp1", "etatLamp2"):
+    Index(f"ix_sensor_readings_{_name.lower()}_on", SensorData.timestamp, postgresql_where=getattr(SensorData, _name) == "ON")
+
 
 class Device(Base):
     __tablename__ = "devices"
@@ -125,27 +173,114 @@ class ForecastData(Base):
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     forecast_date = Column(DateTime, nullable=False)
-    image_data = Column(String)  
+    image_data = Column(String)  # ancien stockage base64, vide apres migrate-forecast-images
+    image_png = Column(LargeBinary)
+    image_sha256 = Column(String(64))
+    thumbnail_data = Column(LargeBinary)
+    thumbnail_sha256 = Column(String(64))
+    thumbnail_media_type = Column(String(32))
     raw_data = Column(String)  
     title = Column(String(255))
+
+
+class DeviceCommand(Base):
+    __tablename__ = "device_commands"
+    __table_args__ = (
+        Index("ix_device_commands_board_status", "board", "status"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    board = Column(String(50), nullable=False)
+    key = Column(String(50), nullable=False)
+    action = Column(String(10), nullable=False)
+    # pending -> delivered (sans accuse) ou in_flight -> acked; superseded si remplacee avant livraison
+    status = Column(String(20), nullable=False, default="pending")
+    issued_at = Column(DateTime, default=datetime.utcnow)
+    delivered_at = Column(DateTime)
+    acked_at = Column(DateTime)
+
+# Agregats pre-calcules (rollups) de sensor_readings par minute, heure et jour
+ROLLUP_GRANULARITIES = ("minute", "hour", "day")
+ROLLUP_STEPS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1)
+}
+ROLLUP_MEASURES = ("U1", "I1", "P1", "U2", "I2", "P2", "currentLamp1", "currentLamp2", "powerLamp1", "powerLamp2")
+ROLLUP_ENERGIES = ("savedEnergyS1", "savedEnergyS2", "savedEnergyT")
+ROLLUP_STATES = ("etatS1", "etatS2", "etatLamp1", "etatLamp2")
+
+class SensorRollup(Base):
+    __tablename__ = "sensor_rollups"
+    
+    granularity = Column(String(10), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    sample_count = Column(Integer, nullable=False, default=0)
+    first_ts = Column(DateTime)
+    last_ts = Column(DateTime)
+
+# Colonnes generees: min/max/somme/nombre de valeurs non nulles par mesure,
+# premiere/derniere valeur des compteurs d'energie et nombre d'echantillons ON par etat
+for _name in ROLLUP_MEASURES:
+    setattr(SensorRollup, f"{_name}_min", Column(Float))
+    setattr(SensorRollup, f"{_name}_max", Column(Float))
+    setattr(SensorRollup, f"{_name}_sum", Column(Float, nullable=False, default=0.0))
+    setattr(SensorRollup, f"{_name}_nonzero", Column(Integer, nullable=False, default=0))
+for _name in ROLLUP_ENERGIES:
+    setattr(SensorRollup, f"{_name}_first", Column(Float))
+    setattr(SensorRollup, f"{_name}_last", Column(Float))
+for _name in ROLLUP_STATES:
+    setattr(SensorRollup, f"{_name}_on", Column(Integer, nullable=False, default=0))
     
 class ForecastResponse(BaseModel):
     id: int
     created_at: datetime
     forecast_date: datetime
     title: str
-    image_data: str
+    image_url: str
+    thumbnail_url: str
     
     class Config:
         from_attributes = True
 
-# Creer les tables
-try:
-    Base.metadata.create_all(bind=engine)
-    logger.info("Tables de base de donnees creees/verifiees avec succes")
-except Exception as e:
-    logger.error(f"Erreur lors de la creation des tables: {str(e)}")
-    raise
+# Schema: execute au demarrage de l'API (DB_AUTO_MIGRATE) ou via "python main.py migrate",
+# pas a l'import du module
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+def init_database():
+    """Verifier la connexion puis creer/mettre a jour les tables et index"""
+    try:
+        with engine.connect() as conn:
+            logger.info("Connexion a  la base de donnees reussie")
+    except Exception as e:
+        logger.error(f"Erreur de connexion a  la base de donnees: {str(e)}")
+        raise
+    
+    # Creer les tables
+    try:
+        Base.metadata.create_all(bind=engine)
+        # create_all ne cree pas les index ajoutes a une table deja existante
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+        # Colonnes ajoutees apres la creation initiale de forecast_data
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE forecast_data ADD COLUMN IF NOT EXISTS image_png BYTEA"))
+            conn.execute(text("ALTER TABLE forecast_data ADD COLUMN IF NOT EXISTS image_sha256 VARCHAR(64)"))
+            conn.execute(text("ALTER TABLE forecast_data ADD COLUMN IF NOT EXISTS thumbnail_data BYTEA"))
+            conn.execute(text("ALTER TABLE forecast_data ADD COLUMN IF NOT EXISTS thumbnail_sha256 VARCHAR(64)"))
+            conn.execute(text("ALTER TABLE forecast_data ADD COLUMN IF NOT EXISTS thumbnail_media_type VARCHAR(32)"))
+        if SENSOR_PARTITIONED:
+            with engine.connect() as conn:
+                partitioned = sensor_readings_is_partitioned(conn)
+            if partitioned:
+                ensure_sensor_partitions()
+            else:
+                logger.warning(f"SENSOR_PARTITION_BY={SENSOR_PARTITION_BY} ignore: sensor_readings existe deja sans partitionnement")
+        logger.info("Tables de base de donnees creees/verifiees avec succes")
+    except Exception as e:
+        logger.error(f"Erreur lors de la creation des tables: {str(e)}")
+        raise
 
 # Modeles Pydantic pour la validation des donnees
 class SensorReading(BaseModel):
@@ -170,6 +305,306 @@ class SensorReading(BaseModel):
     sourceActive: str
     chargeActive: str
 
+# Taille maximale d'un lot recu sur /data/batch
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "5000"))
+
+def sensor_reading_to_row(data: SensorReading) -> dict:
+    """Convertir une lecture validee en dictionnaire de colonnes pour sensor_readings"""
+    return {
+        "device_timestamp": data.timestamp,
+        "U1": data.U1,
+        "I1": data.I1,
+        "P1": data.P1,
+        "U2": data.U2,
+        "I2": data.I2,
+        "P2": data.P2,
+        "currentLamp1": data.currentLamp1,
+        "currentLamp2": data.currentLamp2,
+        "powerLamp1": data.powerLamp1,
+        "powerLamp2": data.powerLamp2,
+        "savedEnergyS1": data.savedEnergyS1,
+        "savedEnergyS2": data.savedEnergyS2,
+        "savedEnergyT": data.savedEnergyT,
+        "etatS1": data.etatS1,
+        "etatS2": data.etatS2,
+        "etatLamp1": data.etatLamp1,
+        "etatLamp2": data.etatLamp2,
+        "sourceActive": data.sourceActive,
+        "chargeActive": data.chargeActive
+    }
+
+# Format binaire compact des lectures (Content-Type application/x-sensor-reading).
+# Corps: un octet de version puis N enregistrements de taille fixe, little-endian:
+#   uint32 timestamp | 10 x float32 (U1, I1, P1, U2, I2, P2, currentLamp1, currentLamp2,
+#   powerLamp1, powerLamp2) | 3 x float64 (savedEnergyS1, savedEnergyS2, savedEnergyT) |
+#   uint8 etats (bit 0 etatS1, bit 1 etatS2, bit 2 etatLamp1, bit 3 etatLamp2; 1 = ON) |
+#   char[8] sourceActive | char[8] chargeActive (ASCII, complete par des zeros)
+# Soit 85 octets par lecture contre ~370 en JSON. Les mesures instantanees en float32 gardent
+# ~7 chiffres significatifs; les compteurs d'energie cumules restent en float64.
+SENSOR_BINARY_CONTENT_TYPE = "application/x-sensor-reading"
+SENSOR_BINARY_VERSION = 1
+SENSOR_BINARY_RECORD = struct.Struct("<I10f3dB8s8s")
+SENSOR_BINARY_NUMERIC_FIELDS = (
+    "device_timestamp", "U1", "I1", "P1", "U2", "I2", "P2",
+    "currentLamp1", "currentLamp2", "powerLamp1", "powerLamp2",
+    "savedEnergyS1", "savedEnergyS2", "savedEnergyT"
+)
+SENSOR_BINARY_STATE_FIELDS = ("etatS1", "etatS2", "etatLamp1", "etatLamp2")
+# Table precalculee: masque d'etats -> valeurs des colonnes etat*
+SENSOR_BINARY_STATES = [
+    tuple("ON" if mask >> bit & 1 else "OFF" for bit in range(len(SENSOR_BINARY_STATE_FIELDS)))
+    for mask in range(1 << len(SENSOR_BINARY_STATE_FIELDS))
+]
+
+def is_sensor_binary(content_type: str) -> bool:
+    return content_type.split(";", 1)[0].strip().lower() == SENSOR_BINARY_CONTENT_TYPE
+
+def decode_sensor_binary(body: bytes) -> List[dict]:
+    """Decoder un corps binaire en dictionnaires de colonnes, sans passer par Pydantic"""
+    if not body:
+        raise ValueError("corps vide")
+    if body[0] != SENSOR_BINARY_VERSION:
+        raise ValueError(f"version de format non supportee: {body[0]}")
+    payload = memoryview(body)[1:]
+    if not payload or len(payload) % SENSOR_BINARY_RECORD.size:
+        raise ValueError(
+            f"taille de {len(payload)} octets incompatible avec des enregistrements de {SENSOR_BINARY_RECORD.size} octets"
+        )
+    
+    rows = []
+    for record in SENSOR_BINARY_RECORD.iter_unpack(payload):
+        if record[14] >= len(SENSOR_BINARY_STATES):
+            raise ValueError(f"masque d'etats invalide: {record[14]}")
+        row = dict(zip(SENSOR_BINARY_NUMERIC_FIELDS, record))
+        row.update(zip(SENSOR_BINARY_STATE_FIELDS, SENSOR_BINARY_STATES[record[14]]))
+        row["sourceActive"] = record[15].rstrip(b"\0").decode("ascii")
+        row["chargeActive"] = record[16].rstrip(b"\0").decode("ascii")
+        rows.append(row)
+    return rows
+
+def encode_sensor_binary(readings: List[dict]) -> bytes:
+    """Encoder des lectures (champs de SensorReading) au format binaire, pour les tests et benchmarks"""
+    chunks = [bytes([SENSOR_BINARY_VERSION])]
+    for reading in readings:
+        states = sum(1 << bit for bit, name in enumerate(SENSOR_BINARY_STATE_FIELDS)
+                     if reading[name].strip() == "ON")
+        chunks.append(SENSOR_BINARY_RECORD.pack(
+            reading["timestamp"],
+            *(reading[name] for name in SENSOR_BINARY_NUMERIC_FIELDS[1:]),
+            states,
+            reading["sourceActive"].encode("ascii"),
+            reading["chargeActive"].encode("ascii")
+        ))
+    return b"".join(chunks)
+
+# Activation des rollups: maintenus a l'ingestion et utilises par les rapports.
+# Apres activation, lancer "python main.py backfill-rollups" pour couvrir l'historique.
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+def rollup_bucket_start(ts: datetime, granularity: str) -> datetime:
+    """Debut du bucket de la granularite donnee contenant ts"""
+    if granularity == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def rollup_from_row(row: dict, granularity: str) -> dict:
+    """Construire le rollup d'une seule lecture (bucket de 1 echantillon)"""
+    ts = row["timestamp"]
+    bucket = {
+        "granularity": granularity,
+        "bucket_start": rollup_bucket_start(ts, granularity),
+        "sample_count": 1,
+        "first_ts": ts,
+        "last_ts": ts
+    }
+    for name in ROLLUP_MEASURES:
+        value = row.get(name)
+        bucket[f"{name}_min"] = value
+        bucket[f"{name}_max"] = value
+        bucket[f"{name}_sum"] = value or 0.0
+        bucket[f"{name}_nonzero"] = 1 if value else 0
+    for name in ROLLUP_ENERGIES:
+        bucket[f"{name}_first"] = row.get(name)
+        bucket[f"{name}_last"] = row.get(name)
+    for name in ROLLUP_STATES:
+        bucket[f"{name}_on"] = 1 if row.get(name) == "ON" else 0
+    return bucket
+
+def merge_rollup(target: dict, other: dict) -> dict:
+    """Fusionner other dans target (meme logique que l'upsert SQL de upsert_rollups)"""
+    target["sample_count"] += other["sample_count"]
+    if other["first_ts"] < target["first_ts"]:
+        target["first_ts"] = other["first_ts"]
+        for name in ROLLUP_ENERGIES:
+            target[f"{name}_first"] = other[f"{name}_first"]
+    if other["last_ts"] >= target["last_ts"]:
+        target["last_ts"] = other["last_ts"]
+        for name in ROLLUP_ENERGIES:
+            target[f"{name}_last"] = other[f"{name}_last"]
+    for name in ROLLUP_MEASURES:
+        mins = [v for v in (target[f"{name}_min"], other[f"{name}_min"]) if v is not None]
+        maxs = [v for v in (target[f"{name}_max"], other[f"{name}_max"]) if v is not None]
+        target[f"{name}_min"] = min(mins) if mins else None
+        target[f"{name}_max"] = max(maxs) if maxs else None
+        target[f"{name}_sum"] += other[f"{name}_sum"]
+        target[f"{name}_nonzero"] += other[f"{name}_nonzero"]
+    for name in ROLLUP_STATES:
+        target[f"{name}_on"] += other[f"{name}_on"]
+    return target
+
+def aggregate_rollup_rows(rows: List[dict]) -> List[dict]:
+    """Agreger des lectures brutes en buckets minute/heure/jour"""
+    buckets = {}
+    for row in rows:
+        for granularity in ROLLUP_GRANULARITIES:
+            single = rollup_from_row(row, granularity)
+            key = (granularity, single["bucket_start"])
+            if key in buckets:
+                merge_rollup(buckets[key], single)
+            else:
+                buckets[key] = single
+    return list(buckets.values())
+
+def upsert_rollups(db: Session, buckets: List[dict]) -> None:
+    """Fusionner des buckets dans sensor_rollups avec INSERT ... ON CONFLICT DO UPDATE"""
+    stmt = pg_insert(SensorRollup).values(buckets)
+    excluded = stmt.excluded
+    current = SensorRollup.__table__.c
+    
+    updates = {
+        "sample_count": current.sample_count + excluded.sample_count,
+        "first_ts": func.least(current.first_ts, excluded.first_ts),
+        "last_ts": func.greatest(current.last_ts, excluded.last_ts)
+    }
+    for name in ROLLUP_MEASURES:
+        updates[f"{name}_min"] = func.least(current[f"{name}_min"], excluded[f"{name}_min"])
+        updates[f"{name}_max"] = func.greatest(current[f"{name}_max"], excluded[f"{name}_max"])
+        updates[f"{name}_sum"] = current[f"{name}_sum"] + excluded[f"{name}_sum"]
+        updates[f"{name}_nonzero"] = current[f"{name}_nonzero"] + excluded[f"{name}_nonzero"]
+    for name in ROLLUP_ENERGIES:
+        updates[f"{name}_first"] = case(
+            (excluded.first_ts < current.first_ts, excluded[f"{name}_first"]),
+            else_=current[f"{name}_first"]
+        )
+        updates[f"{name}_last"] = case(
+            (excluded.last_ts >= current.last_ts, excluded[f"{name}_last"]),
+            else_=current[f"{name}_last"]
+        )
+    for name in ROLLUP_STATES:
+        updates[f"{name}_on"] = current[f"{name}_on"] + excluded[f"{name}_on"]
+    
+    db.execute(stmt.on_conflict_do_update(index_elements=["granularity", "bucket_start"], set_=updates))
+
+def update_rollups(db: Session, rows: List[dict]) -> None:
+    """
+    Mettre a jour les rollups dans la transaction d'ingestion courante. A appeler en dernier
+    avant le commit: les lignes de rollup chaudes restent verrouillees le moins longtemps possible.
+    Les buckets sont tries pour que deux transactions concurrentes verrouillent les memes
+    lignes dans le meme ordre (pas d'interblocage entre lots).
+    """
+    if ROLLUPS_ENABLED and rows:
+        buckets = aggregate_rollup_rows(rows)
+        buckets.sort(key=lambda bucket: (bucket["granularity"], bucket["bucket_start"]))
+        upsert_rollups(db, buckets)
+
+def plan_rollup_ranges(start: datetime, end: datetime, levels=("day", "hour", "minute")) -> List[tuple]:
+    """
+    Decouper [start, end) en plages couvertes par la granularite la plus grossiere possible.
+    start et end doivent etre alignes sur la minute.
+    """
+    granularity = levels[0]
+    if len(levels) == 1:
+        return [(granularity, start, end)] if start < end else []
+    
+    inner_start = rollup_bucket_start(start, granularity)
+    if inner_start < start:
+        inner_start += ROLLUP_STEPS[granularity]
+    inner_end = rollup_bucket_start(end, granularity)
+    
+    if inner_start >= inner_end:
+        return plan_rollup_ranges(start, end, levels[1:])
+    
+    return (
+        plan_rollup_ranges(start, inner_start, levels[1:])
+        + [(granularity, inner_start, inner_end)]
+        + plan_rollup_ranges(inner_end, end, levels[1:])
+    )
+
+def load_rollup_summary(db: Session, start: datetime, end: datetime) -> Optional[dict]:
+    """Fusionner les rollups couvrant [start, end) en un seul agregat (None si aucune donnee)"""
+    ranges = plan_rollup_ranges(start, end)
+    if not ranges:
+        return None
+    
+    buckets = db.query(SensorRollup).filter(or_(*[
+        and_(
+            SensorRollup.granularity == granularity,
+            SensorRollup.bucket_start >= range_start,
+            SensorRollup.bucket_start < range_end
+        )
+        for granularity, range_start, range_end in ranges
+    ])).all()
+    
+    columns = [column.name for column in SensorRollup.__table__.columns]
+    summary = None
+    for bucket in buckets:
+        values = {name: getattr(bucket, name) for name in columns}
+        summary = values if summary is None else merge_rollup(summary, values)
+    return summary
+
+def backfill_rollups(start: Optional[datetime] = None, end: Optional[datetime] = None, chunk_size: int = 5000) -> int:
+    """
+    Recalculer les rollups a partir de sensor_readings sur des jours complets.
+    Les buckets existants de la plage sont remplaces, ce qui rend la commande rejouable.
+    """
+    db = SessionLocal()
+    try:
+        first_ts, last_ts = db.query(func.min(SensorData.timestamp), func.max(SensorData.timestamp)).one()
+        if first_ts is None:
+            logger.info("Backfill des rollups - aucune donnee")
+            return 0
+        
+        range_start = rollup_bucket_start(start or first_ts, "day")
+        range_end = rollup_bucket_start(end or last_ts, "day") + ROLLUP_STEPS["day"]
+        logger.info(f"Backfill des rollups - Periode: {range_start} a {range_end}")
+        
+        db.query(SensorRollup).filter(
+            SensorRollup.bucket_start >= range_start,
+            SensorRollup.bucket_start < range_end
+        ).delete(synchronize_session=False)
+        
+        columns = [SensorData.timestamp] + [
+            getattr(SensorData, name) for name in ROLLUP_MEASURES + ROLLUP_ENERGIES + ROLLUP_STATES
+        ]
+        readings = db.query(*columns).filter(
+            SensorData.timestamp >= range_start,
+            SensorData.timestamp < range_end
+        ).order_by(SensorData.timestamp.asc()).yield_per(chunk_size)
+        
+        processed = 0
+        chunk = []
+        for reading in readings:
+            chunk.append(reading._asdict())
+            if len(chunk) >= chunk_size:
+                upsert_rollups(db, aggregate_rollup_rows(chunk))
+                processed += len(chunk)
+                chunk = []
+                logger.info(f"Backfill des rollups - {processed} lectures traitees")
+        if chunk:
+            upsert_rollups(db, aggregate_rollup_rows(chunk))
+            processed += len(chunk)
+        
+        db.commit()
+        logger.info(f"Backfill des rollups termine - {processed} lectures agregees")
+        return processed
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
 class SensorReadingResponse(BaseModel):
     id: int
     timestamp: datetime
@@ -224,10 +659,42 @@ class DeviceResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+# Endpoints interroges en continu (/data/latest, /data/history, /devices): les lignes viennent
+# de notre base et sont deja typees, elles sont serialisees par orjson sans revalidation Pydantic.
+# Les response_model restent declares pour le schema OpenAPI.
+SENSOR_READING_FIELDS = tuple(SensorReadingResponse.model_fields)
+DEVICE_FIELDS = tuple(DeviceResponse.model_fields)
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+    
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+# Requetes conditionnelles: l'ETag des endpoints interroges en continu est derive de la derniere
+# lecture ou des appareils (updated_at). Si le client a deja cette version: 304 sans corps.
+POLL_CACHE_CONTROL = "no-cache"
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+def not_modified_response(etag: str, cache_control: str = POLL_CACHE_CONTROL) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
   
 class LampControl(BaseModel):
     lamp_id: int  
     action: str  
+    board: str = "default"
+
+class CommandAck(BaseModel):
+    board: str = "default"
+    ids: List[int]
 
 class LampControlResponse(BaseModel):
     status: str
@@ -237,6 +704,12 @@ class LampControlResponse(BaseModel):
 
 app = FastAPI(title="Systeme de Gestion Hybride API", version="1.0.0")
 
+@app.on_event("startup")
+def migrate_database():
+    # Enregistre en premier: les autres hooks de demarrage supposent le schema a jour
+    if DB_AUTO_MIGRATE:
+        init_database()
+
 SOLCAST_API_KEY = os.getenv("SOLCAST_API_KEY")
 SOLCAST_SITE_ID = os.getenv("SOLCAST_SITE_ID")
 SOLCAST_BASE_URL = os.getenv("SOLCAST_BASE_URL")
@@ -263,87 +736,549 @@ def get_db():
     finally:
         db.close()
 
+# Cache en memoire de la derniere lecture pour /data/latest et /data/stats.
+# Le worker qui ingere une lecture met le cache a jour immediatement. Les lectures recues par
+# les autres workers uvicorn sont vues au plus tard apres LATEST_CACHE_TTL_MS (relecture en base),
+# et le nombre total de lectures est recompte au plus tard apres STATS_COUNT_TTL_S.
+LATEST_CACHE_TTL_MS = int(os.getenv("LATEST_CACHE_TTL_MS", "1000"))
+STATS_COUNT_TTL_S = int(os.getenv("STATS_COUNT_TTL_S", "60"))
+
+latest_cache_lock = threading.Lock()
+latest_cache = {"reading": None, "reading_at": 0.0, "count": None, "count_at": 0.0}
+
+def reading_to_dict(reading: SensorData) -> dict:
+    """Copier les colonnes d'une lecture ORM dans un dictionnaire independant de la session"""
+    return {column.name: getattr(reading, column.name) for column in SensorData.__table__.columns}
+
+def cache_latest_reading(row: dict, inserted: int = 1) -> None:
+    """Publier dans le cache une lecture qui vient d'etre enregistree par ce worker"""
+    with latest_cache_lock:
+        current = latest_cache["reading"]
+        if current is None or (row["timestamp"], row["id"]) >= (current["timestamp"], current["id"]):
+            latest_cache["reading"] = row
+        if latest_cache["count"] is not None:
+            latest_cache["count"] += inserted
+    publish_reading(row)
+
+def invalidate_latest_cache() -> None:
+    """Forcer une relecture en base (apres suppression de lectures)"""
+    with latest_cache_lock:
+        latest_cache.update({"reading": None, "reading_at": 0.0, "count": None, "count_at": 0.0})
+
+def get_cached_latest(db: Session, with_count: bool = False) -> tuple:
+    """Retourner (derniere lecture, nombre total de lectures) en ne lisant la base qu'a expiration"""
+    now = time.monotonic()
+    with latest_cache_lock:
+        reading = latest_cache["reading"]
+        reading_fresh = reading is not None and now - latest_cache["reading_at"] < LATEST_CACHE_TTL_MS / 1000
+        count = latest_cache["count"]
+        count_fresh = count is not None and now - latest_cache["count_at"] < STATS_COUNT_TTL_S
+    
+    if not reading_fresh:
+        latest = db.query(SensorData).order_by(SensorData.timestamp.desc(), SensorData.id.desc()).first()
+        with latest_cache_lock:
+            latest_cache["reading_at"] = now
+            if latest is not None:
+                current = latest_cache["reading"]
+                if current is None or (latest.timestamp, latest.id) >= (current["timestamp"], current["id"]):
+                    latest_cache["reading"] = reading_to_dict(latest)
+            reading = latest_cache["reading"]
+    
+    if with_count and not count_fresh:
+        count = db.query(func.count(SensorData.id)).scalar()
+        with latest_cache_lock:
+            latest_cache["count"] = count
+            latest_cache["count_at"] = now
+    
+    return reading, count
+
+# Diffusion temps reel des lectures (Server-Sent Events) sur /stream/readings.
+# Chaque abonne a une file bornee; un client trop lent pour la vider est deconnecte
+# (EventSource se reconnecte alors automatiquement et repart de la derniere lecture).
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "32"))
+STREAM_KEEPALIVE_S = int(os.getenv("STREAM_KEEPALIVE_S", "15"))
+
+stream_subscribers = set()
+stream_last_key: Optional[tuple] = None
+stream_loop: Optional[asyncio.AbstractEventLoop] = None
+stream_poller_task: Optional[asyncio.Task] = None
+
+def fan_out_reading(row: dict) -> None:
+    """Envoyer une lecture a tous les abonnes (appele dans la boucle d'evenements)"""
+    global stream_last_key
+    key = (row["timestamp"], row["id"])
+    if stream_last_key is not None and key <= stream_last_key:
+        return
+    stream_last_key = key
+    
+    payload = json.dumps(jsonable_encoder(row))
+    for queue in list(stream_subscribers):
+        try:
+            queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # Client lent: on vide sa file et on termine son flux
+            stream_subscribers.discard(queue)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+            logger.warning("Abonne /stream/readings trop lent - deconnecte")
+
+def publish_reading(row: dict) -> None:
+    """Publier une lecture depuis n'importe quel thread"""
+    if stream_loop is not None and stream_subscribers:
+        stream_loop.call_soon_threadsafe(fan_out_reading, row)
+
+def poll_latest_reading() -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        reading, _ = get_cached_latest(db)
+        return reading
+    finally:
+        db.close()
+
+async def stream_poller():
+    """Relayer les lectures ingerees par les autres workers, seulement s'il y a des abonnes"""
+    while True:
+        await asyncio.sleep(LATEST_CACHE_TTL_MS / 1000)
+        if not stream_subscribers:
+            continue
+        try:
+            reading = await run_in_threadpool(poll_latest_reading)
+            if reading:
+                fan_out_reading(reading)
+        except Exception as e:
+            logger.error(f"Erreur lors de la relecture de la derniere lecture pour le flux: {str(e)}")
+
+@app.on_event("startup")
+async def start_reading_stream():
+    global stream_loop, stream_poller_task
+    stream_loop = asyncio.get_running_loop()
+    stream_poller_task = asyncio.create_task(stream_poller())
+
+@app.on_event("shutdown")
+async def stop_reading_stream():
+    if stream_poller_task is not None:
+        stream_poller_task.cancel()
+    for queue in list(stream_subscribers):
+        queue.put_nowait(None)
+    stream_subscribers.clear()
+
+# Tampon d'ingestion (write-behind) pour POST /data
+# INGEST_MODE=buffered: les lectures sont mises en file et ecrites par lots en arriere-plan
+INGEST_MODE = os.getenv("INGEST_MODE", "direct").lower()
+INGEST_BUFFER_SIZE = int(os.getenv("INGEST_BUFFER_SIZE", "10000"))
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "500"))
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", "200"))
+# "reject" -> 429 quand le tampon est plein, "block" -> attente jusqu'a INGEST_BLOCK_TIMEOUT_MS
+INGEST_BACKPRESSURE = os.getenv("INGEST_BACKPRESSURE", "reject").lower()
+INGEST_BLOCK_TIMEOUT_MS = int(os.getenv("INGEST_BLOCK_TIMEOUT_MS", "1000"))
+# Ecriture en echec: nouvel essai du meme lot avec un delai exponentiel plafonne
+INGEST_RETRY_MS = int(os.getenv("INGEST_RETRY_MS", "500"))
+INGEST_RETRY_MAX_MS = int(os.getenv("INGEST_RETRY_MAX_MS", "30000"))
+# Duree maximale accordee a la vidange du tampon a l'arret
+INGEST_SHUTDOWN_TIMEOUT_S = float(os.getenv("INGEST_SHUTDOWN_TIMEOUT_S", "30"))
+
+ingest_queue: Optional[asyncio.Queue] = None
+ingest_flusher_task: Optional[asyncio.Task] = None
+# Places du tampon: prises a l'acceptation, rendues une fois la lecture ecrite en base.
+# Les lectures deja retirees de la file par le flusher comptent donc jusqu'a leur ecriture.
+ingest_capacity: Optional[asyncio.Semaphore] = None
+ingest_pending = 0
+ingest_accepting = False
+
+def insert_sensor_rows(rows: List[dict]) -> None:
+    """Inserer un groupe de lectures dans une seule transaction (execute dans le pool de threads)"""
+    db = SessionLocal()
+    try:
+        insert_sensor_rows_returning_ids(db, rows)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def flush_ingest_rows(rows: List[dict]) -> None:
+    """Ecrire un groupe de lectures sans bloquer la boucle d'evenements, en reessayant jusqu'au succes"""
+    global ingest_pending
+    attempt = 0
+    while True:
+        try:
+            await run_in_threadpool(insert_sensor_rows, rows)
+            break
+        except Exception as e:
+            attempt += 1
+            delay_ms = min(INGEST_RETRY_MAX_MS, INGEST_RETRY_MS * 2 ** (attempt - 1))
+            logger.error(
+                f"ERREUR lors de l'ecriture groupee de {len(rows)} lectures (tentative {attempt}), "
+                f"nouvel essai dans {delay_ms}ms: {str(e)}"
+            )
+            await asyncio.sleep(delay_ms / 1000)
+    
+    ingest_pending -= len(rows)
+    for _ in rows:
+        ingest_capacity.release()
+    logger.debug(f"Tampon d'ingestion vide - {len(rows)} lectures ecrites")
+
+async def ingest_flusher():
+    """
+    Vider le tampon toutes les INGEST_FLUSH_ROWS lectures ou INGEST_FLUSH_MS millisecondes.
+    S'arrete sur la sentinelle None apres avoir ecrit le lot en cours et tout ce qui reste en file.
+    """
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        row = await ingest_queue.get()
+        if row is None:
+            break
+        rows = [row]
+        deadline = loop.time() + INGEST_FLUSH_MS / 1000
+        
+        while len(rows) < INGEST_FLUSH_ROWS:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(ingest_queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if row is None:
+                stopping = True
+                break
+            rows.append(row)
+        
+        await flush_ingest_rows(rows)
+    
+    # Lectures acceptees juste avant l'arret (placees derriere la sentinelle)
+    rows = []
+    while not ingest_queue.empty():
+        row = ingest_queue.get_nowait()
+        if row is not None:
+            rows.append(row)
+    for start in range(0, len(rows), INGEST_FLUSH_ROWS):
+        await flush_ingest_rows(rows[start:start + INGEST_FLUSH_ROWS])
+
+async def enqueue_sensor_row(row: dict) -> None:
+    """Ajouter une lecture au tampon en appliquant la contre-pression configuree"""
+    global ingest_pending
+    if not ingest_accepting:
+        raise HTTPException(status_code=503, detail="Arret en cours, reessayez plus tard")
+    
+    if ingest_capacity.locked():
+        if INGEST_BACKPRESSURE != "block":
+            logger.warning(f"Tampon d'ingestion plein ({INGEST_BUFFER_SIZE} lectures) - lecture refusee")
+            raise HTTPException(status_code=429, detail="Tampon d'ingestion plein, reessayez plus tard")
+        try:
+            await asyncio.wait_for(ingest_capacity.acquire(), timeout=INGEST_BLOCK_TIMEOUT_MS / 1000)
+        except asyncio.TimeoutError:
+            logger.warning(f"Tampon d'ingestion plein ({INGEST_BUFFER_SIZE} lectures) - lecture refusee")
+            raise HTTPException(status_code=429, detail="Tampon d'ingestion plein, reessayez plus tard")
+        if not ingest_accepting:
+            ingest_capacity.release()
+            raise HTTPException(status_code=503, detail="Arret en cours, reessayez plus tard")
+    else:
+        await ingest_capacity.acquire()
+    
+    ingest_pending += 1
+    ingest_queue.put_nowait(row)
+
+@app.on_event("startup")
+async def configure_db_threadpool():
+    # Les endpoints synchrones et les appels run_in_threadpool partagent ce limiteur:
+    # il borne le nombre de sessions SQLAlchemy utilisees en parallele
+    anyio.to_thread.current_default_thread_limiter().total_tokens = DB_THREADPOOL_SIZE
+    logger.info(f"Pool de threads BDD: {DB_THREADPOOL_SIZE} - Pool de connexions: {DB_POOL_SIZE} (+{DB_MAX_OVERFLOW})")
+
+@app.on_event("startup")
+async def start_ingest_buffer():
+    global ingest_queue, ingest_flusher_task, ingest_capacity, ingest_accepting
+    if INGEST_MODE == "buffered":
+        # File non bornee: la limite est portee par ingest_capacity
+        ingest_queue = asyncio.Queue()
+        ingest_capacity = asyncio.Semaphore(INGEST_BUFFER_SIZE)
+        ingest_accepting = True
+        ingest_flusher_task = asyncio.create_task(ingest_flusher())
+        logger.info(f"Ingestion tamponnee activee - Tampon: {INGEST_BUFFER_SIZE}, Lot: {INGEST_FLUSH_ROWS} lectures / {INGEST_FLUSH_MS}ms")
+
+@app.on_event("shutdown")
+async def stop_ingest_buffer():
+    global ingest_accepting
+    if ingest_flusher_task is None:
+        return
+    
+    # Plus aucune lecture acceptee, puis vidange complete (lot en cours compris) avant l'arret
+    ingest_accepting = False
+    pending = ingest_pending
+    ingest_queue.put_nowait(None)
+    try:
+        await asyncio.wait_for(ingest_flusher_task, timeout=INGEST_SHUTDOWN_TIMEOUT_S)
+        logger.info(f"Tampon d'ingestion arrete - {pending} lectures ecrites a l'arret")
+    except asyncio.TimeoutError:
+        logger.error(
+            f"Tampon d'ingestion arrete apres {INGEST_SHUTDOWN_TIMEOUT_S:.0f}s - "
+            f"{ingest_pending} lectures acceptees n'ont pas pu etre ecrites"
+        )
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "ETag"],
 )
 
 @app.get("/")
 async def home(request: Request):
     return templates.TemplateResponse("indexa.html", {"request": request})
 
+def save_sensor_reading(db: Session, row: dict) -> SensorData:
+    """Enregistrer une lecture et recharger l'id / timestamp attribues par la base"""
+    db_reading = SensorData(**row)
+    db.add(db_reading)
+    db.flush()
+    update_rollups(db, [row])
+    db.commit()
+    db.refresh(db_reading)
+    cache_latest_reading(reading_to_dict(db_reading))
+    return db_reading
+
+def insert_sensor_rows_returning_ids(db: Session, rows: List[dict]) -> List[int]:
+    """Inserer plusieurs lectures en une requete multi-lignes et retourner leurs ids (dans l'ordre de rows)"""
+    inserted_ids = db.execute(
+        insert(SensorData).returning(SensorData.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    update_rollups(db, rows)
+    db.commit()
+    if inserted_ids:
+        cache_latest_reading({**rows[-1], "id": inserted_ids[-1]}, inserted=len(inserted_ids))
+    return inserted_ids
+
+reading_log_counter = itertools.count()
+
+def log_sensor_reading(row: dict, reading_id: Optional[int]) -> None:
+    """Une ligne compacte par lecture (echantillonnee selon LOG_READING_SAMPLE_EVERY)"""
+    if next(reading_log_counter) % LOG_READING_SAMPLE_EVERY:
+        return
+    logger.info(
+        "Lecture id=%s ts=%s S1=%sV/%sA/%sW/%s S2=%sV/%sA/%sW/%s L1=%sA/%sW/%s L2=%sA/%sW/%s E=%s/%s/%skWh src=%s charge=%s",
+        reading_id, row["device_timestamp"],
+        row["U1"], row["I1"], row["P1"], row["etatS1"],
+        row["U2"], row["I2"], row["P2"], row["etatS2"],
+        row["currentLamp1"], row["powerLamp1"], row["etatLamp1"],
+        row["currentLamp2"], row["powerLamp2"], row["etatLamp2"],
+        row["savedEnergyS1"], row["savedEnergyS2"], row["savedEnergyT"],
+        row["sourceActive"], row["chargeActive"]
+    )
+
 # Endpoints
-@app.post("/data", response_model=dict)
-async def receive_sensor_data(data: SensorReading, db: Session = Depends(get_db)):
+@app.post("/data", response_model=dict, openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": SensorReading.model_json_schema()},
+            SENSOR_BINARY_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}}
+        }
+    }
+})
+async def receive_sensor_data(request: Request, db: Session = Depends(get_db)):
     """
-    Recevoir et stocker les donnees des capteurs de l'ESP32
+    Recevoir et stocker les donnees des capteurs de l'ESP32 (JSON ou format binaire compact)
     """
-    # Log des donnees recues
-    logger.info("=== DONNEES RECUES ===")
-    logger.info(f"Timestamp ESP32: {data.timestamp}")
-    logger.info(f"Source 1 - U1: {data.U1}V, I1: {data.I1}A, P1: {data.P1}W, Etat: {data.etatS1}")
-    logger.info(f"Source 2 - U2: {data.U2}V, I2: {data.I2}A, P2: {data.P2}W, Etat: {data.etatS2}")
-    logger.info(f"Lampe 1 - Courant: {data.currentLamp1}A, Puissance: {data.powerLamp1}W, Etat: {data.etatLamp1}")
-    logger.info(f"Lampe 2 - Courant: {data.currentLamp2}A, Puissance: {data.powerLamp2}W, Etat: {data.etatLamp2}")
-    logger.info(f"Energie sauvee - S1: {data.savedEnergyS1}kWh, S2: {data.savedEnergyS2}kWh, Total: {data.savedEnergyT}kWh")
-    logger.info(f"Source active: {data.sourceActive}, Charge active: {data.chargeActive}")
+    body = await request.body()
+    if is_sensor_binary(request.headers.get("content-type", "")):
+        try:
+            rows = decode_sensor_binary(body)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise HTTPException(status_code=400, detail=f"Lecture binaire invalide: {str(e)}")
+        if len(rows) != 1:
+            raise HTTPException(status_code=400, detail="Une seule lecture attendue, utiliser /data/batch pour un lot")
+        row = rows[0]
+    else:
+        try:
+            row = sensor_reading_to_row(SensorReading.model_validate_json(body))
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False))
+    row["timestamp"] = datetime.utcnow()
+    
+    if ingest_queue is not None:
+        # Mode tamponne: l'horodatage est fixe a la reception, l'ecriture est differee
+        await enqueue_sensor_row(row)
+        log_sensor_reading(row, None)
+        return {"status": "accepted", "id": None, "message": "Donnees recues et mises en file d'attente"}
     
     try:
-        db_reading = SensorData(
-            device_timestamp=data.timestamp,
-            U1=data.U1,
-            I1=data.I1,
-            P1=data.P1,
-            U2=data.U2,
-            I2=data.I2,
-            P2=data.P2,
-            currentLamp1=data.currentLamp1,
-            currentLamp2=data.currentLamp2,
-            powerLamp1=data.powerLamp1,
-            powerLamp2=data.powerLamp2,
-            savedEnergyS1=data.savedEnergyS1,
-            savedEnergyS2=data.savedEnergyS2,
-            savedEnergyT=data.savedEnergyT,
-            etatS1=data.etatS1,
-            etatS2=data.etatS2,
-            etatLamp1=data.etatLamp1,
-            etatLamp2=data.etatLamp2,
-            sourceActive=data.sourceActive,
-            chargeActive=data.chargeActive
-        )
-        
-        db.add(db_reading)
-        db.commit()
-        db.refresh(db_reading)
+        db_reading = await run_in_threadpool(save_sensor_reading, db, row)
         
-        logger.info(f"Donnees enregistrees avec succes - ID: {db_reading.id}, Timestamp DB: {db_reading.timestamp}")
+        log_sensor_reading(row, db_reading.id)
         
         return {"status": "success", "id": db_reading.id, "message": "Donnees recues et enregistrees"}
     
     except Exception as e:
         db.rollback()
         logger.error(f"ERREUR lors de l'enregistrement des donnees: {str(e)}")
-        logger.error(f"Donnees qui ont cause l'erreur: {json.dumps(data.dict(), indent=2, default=str)}")
+        logger.error(f"Donnees qui ont cause l'erreur: {json.dumps(row, indent=2, default=str)}")
+        raise HTTPException(status_code=500, detail=f"Erreur lors de l'enregistrement: {str(e)}")
+
+class InvalidBatchLine(str):
+    """Ligne NDJSON illisible, conservee a son index avec le message d'erreur"""
+
+@app.post("/data/batch", response_model=dict)
+async def receive_sensor_data_batch(request: Request, db: Session = Depends(get_db)):
+    """
+    Recevoir un lot de lectures (tableau JSON, NDJSON ou format binaire compact) et les
+    inserer en une seule requete
+    """
+    started = time.perf_counter()
+    
+    try:
+        body = await request.body()
+        content_type = request.headers.get("content-type", "")
+        
+        # Decodage du lot: format binaire (enregistrements de taille fixe decodes directement
+        # en lignes), NDJSON (une lecture par ligne) ou tableau JSON
+        binary = is_sensor_binary(content_type)
+        if binary:
+            if len(body) > 1 + BATCH_MAX_SIZE * SENSOR_BINARY_RECORD.size:
+                raise HTTPException(status_code=413, detail=f"Lot trop volumineux (max {BATCH_MAX_SIZE} lectures)")
+            items = decode_sensor_binary(body)
+        elif "ndjson" in content_type or "jsonlines" in content_type:
+            # Une ligne illisible est rejetee seule, les autres lectures du lot sont traitees
+            items = []
+            for line in body.decode("utf-8").splitlines():
+                line = line.strip()
+                if line:
+                    try:
+                        items.append(json.loads(line))
+                    except ValueError as e:
+                        items.append(InvalidBatchLine(str(e)))
+        else:
+            items = json.loads(body)
+    except (ValueError, UnicodeDecodeError) as e:
+        logger.error(f"Lot de donnees illisible: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Corps de requete invalide: {str(e)}")
+    
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Le corps doit etre un tableau JSON ou du NDJSON")
+    
+    if len(items) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Lot trop volumineux (max {BATCH_MAX_SIZE} lectures)")
+    
+    received_at = datetime.utcnow()
+    if binary:
+        # Les enregistrements binaires sont deja des lignes typees: pas de validation par champ
+        rows = items
+        for row in rows:
+            row["timestamp"] = received_at
+        row_indexes = range(len(rows))
+        results = [{"index": index, "status": "pending"} for index in row_indexes]
+    else:
+        # Validation en une seule passe, en conservant le statut de chaque element
+        results = []
+        rows = []
+        row_indexes = []
+        for index, item in enumerate(items):
+            try:
+                if isinstance(item, InvalidBatchLine):
+                    raise ValueError(f"JSON invalide: {item}")
+                if not isinstance(item, dict):
+                    raise TypeError("chaque lecture doit etre un objet JSON")
+                row = sensor_reading_to_row(SensorReading(**item))
+                row["timestamp"] = received_at
+                rows.append(row)
+                row_indexes.append(index)
+                results.append({"index": index, "status": "pending"})
+            except (ValueError, TypeError) as e:
+                results.append({"index": index, "status": "error", "error": str(e)})
+    
+    parsed = time.perf_counter()
+    
+    try:
+        if rows:
+            # Insertion multi-lignes unique pour tout le lot
+            inserted_ids = await run_in_threadpool(insert_sensor_rows_returning_ids, db, rows)
+            for index, row_id in zip(row_indexes, inserted_ids):
+                results[index]["status"] = "success"
+                results[index]["id"] = row_id
+    
+    except Exception as e:
+        db.rollback()
+        logger.error(f"ERREUR lors de l'enregistrement du lot: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'enregistrement: {str(e)}")
+    
+    finished = time.perf_counter()
+    elapsed = finished - started
+    accepted = len(rows)
+    rejected = len(items) - accepted
+    
+    logger.info(f"Lot enregistre - {accepted} lectures inserees, {rejected} rejetees en {elapsed * 1000:.1f}ms")
+    
+    return {
+        "status": "success" if rejected == 0 else "partial",
+        "received": len(items),
+        "inserted": accepted,
+        "rejected": rejected,
+        "results": results,
+        "timing": {
+            "parse_ms": round((parsed - started) * 1000, 3),
+            "insert_ms": round((finished - parsed) * 1000, 3),
+            "total_ms": round(elapsed * 1000, 3),
+            "rows_per_second": round(accepted / elapsed, 1) if elapsed > 0 else None
+        }
+    }
+
+@app.get("/stream/readings")
+async def stream_readings():
+    """
+    Flux Server-Sent Events des nouvelles lectures (evenement "reading", donnees JSON
+    au format de /data/latest). La derniere lecture connue est envoyee a la connexion.
+    """
+    queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    with latest_cache_lock:
+        latest = latest_cache["reading"]
+    if latest is not None:
+        queue.put_nowait(json.dumps(jsonable_encoder(latest)))
+    stream_subscribers.add(queue)
+    logger.info(f"Nouvel abonne /stream/readings - {len(stream_subscribers)} abonnes")
+    
+    async def events():
+        try:
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if payload is None:
+                    break
+                yield f"event: reading\ndata: {payload}\n\n"
+        finally:
+            stream_subscribers.discard(queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/data/latest", response_model=SensorReadingResponse)
-async def get_latest_data(db: Session = Depends(get_db)):
+def get_latest_data(request: Request, db: Session = Depends(get_db)):
     """
     Recuperer les dernieres donnees enregistrees
     """
     try:
         logger.info("Requaªte pour recuperer les dernieres donnees")
-        latest_reading = db.query(SensorData).order_by(SensorData.timestamp.desc()).first()
+        latest_reading, _ = get_cached_latest(db)
         
         if not latest_reading:
             logger.warning("Aucune donnee trouvee dans la base")
             raise HTTPException(status_code=404, detail="Aucune donnee trouvee")
         
-        logger.info(f"Dernieres donnees recuperees - ID: {latest_reading.id}, Timestamp: {latest_reading.timestamp}")
-        return latest_reading
+        etag = f'"reading-{latest_reading["id"]}"'
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        
+        logger.info(f"Dernieres donnees recuperees - ID: {latest_reading['id']}, Timestamp: {latest_reading['timestamp']}")
+        return FastJSONResponse(latest_reading, headers={"ETag": etag, "Cache-Control": POLL_CACHE_CONTROL})
         
     except HTTPException:
         raise
@@ -351,21 +1286,48 @@ async def get_latest_data(db: Session = Depends(get_db)):
         logger.error(f"Erreur lors de la recuperation des dernieres donnees: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
 
+def encode_history_cursor(reading: SensorData) -> str:
+    """Encoder la cle (timestamp, id) d'une lecture en curseur opaque"""
+    raw = f"{reading.timestamp.isoformat()}|{reading.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_history_cursor(cursor: str) -> tuple:
+    """Decoder un curseur de /data/history en (timestamp, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, reading_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(reading_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+
 @app.get("/data/history", response_model=List[SensorReadingResponse])
-async def get_data_history(
+def get_data_history(
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    before: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
+    layout: str = "records",
     db: Session = Depends(get_db)
 ):
     """
-    Recuperer l'historique des donnees avec pagination et filtres de date
+    Recuperer l'historique des donnees avec pagination et filtres de date.
+    
+    Pagination par curseur: passer la valeur de l'en-tete X-Next-Cursor dans `cursor` pour la
+    page suivante (plus ancienne), ou celle de X-Prev-Cursor dans `before` pour la precedente.
+    Le cout d'une page ne depend pas de sa position. `offset` reste supporte.
+    
+    layout=columnar renvoie un objet {champ: [valeurs]} au lieu d'une liste d'objets.
     """
+    if layout not in ("records", "columnar"):
+        raise HTTPException(status_code=400, detail="layout invalide. Utilisez: records, columnar")
+    
     try:
-        logger.info(f"Requaªte historique - Limit: {limit}, Offset: {offset}, Start: {start_date}, End: {end_date}")
+        logger.info(f"Requaªte historique - Limit: {limit}, Offset: {offset}, Cursor: {cursor}, Before: {before}, Start: {start_date}, End: {end_date}")
         
-        query = db.query(SensorData)
+        # Tuples de colonnes plutot qu'objets ORM
+        query = db.query(*(getattr(SensorData, name) for name in SENSOR_READING_FIELDS))
         
         if start_date:
             query = query.filter(SensorData.timestamp >= start_date)
@@ -375,32 +1337,197 @@ async def get_data_history(
             query = query.filter(SensorData.timestamp <= end_date)
             logger.info(f"Filtre applique - Date fin: {end_date}")
         
-        readings = query.order_by(SensorData.timestamp.desc()).offset(offset).limit(limit).all()
+        key = tuple_(SensorData.timestamp, SensorData.id)
+        
+        if before:
+            # Page precedente: lignes plus recentes que le curseur, relues dans l'ordre croissant
+            readings = query.filter(key > decode_history_cursor(before)).order_by(
+                SensorData.timestamp.asc(), SensorData.id.asc()
+            ).limit(limit + 1).all()
+            has_newer = len(readings) > limit
+            readings = readings[:limit][::-1]
+            has_older = True
+        else:
+            query = query.order_by(SensorData.timestamp.desc(), SensorData.id.desc())
+            if cursor:
+                query = query.filter(key < decode_history_cursor(cursor))
+            else:
+                query = query.offset(offset)
+            readings = query.limit(limit + 1).all()
+            has_older = len(readings) > limit
+            readings = readings[:limit]
+            has_newer = bool(cursor) or offset > 0
+        
+        headers = {}
+        if readings and has_older:
+            headers["X-Next-Cursor"] = encode_history_cursor(readings[-1])
+        if readings and has_newer:
+            headers["X-Prev-Cursor"] = encode_history_cursor(readings[0])
         
         logger.info(f"Historique recupere - {len(readings)} enregistrements")
-        return readings
+        if layout == "columnar":
+            content = {name: [reading[i] for reading in readings] for i, name in enumerate(SENSOR_READING_FIELDS)}
+        else:
+            content = [dict(zip(SENSOR_READING_FIELDS, reading)) for reading in readings]
+        return FastJSONResponse(content, headers=headers)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la recuperation de l'historique: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
 
+# Export en masse: lecture par curseur serveur (yield_per) et envoi lot par lot,
+# la memoire reste constante quelle que soit la plage demandee
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+def iter_export_chunks(start_date: Optional[datetime], end_date: Optional[datetime]):
+    """Lots de lignes (tuples) de sensor_readings dans l'ordre chronologique"""
+    db = SessionLocal()
+    try:
+        query = select(*SensorData.__table__.columns).order_by(SensorData.timestamp.asc(), SensorData.id.asc())
+        if start_date:
+            query = query.where(SensorData.timestamp >= start_date)
+        if end_date:
+            query = query.where(SensorData.timestamp <= end_date)
+        result = db.execute(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        for rows in result.partitions():
+            yield rows
+    finally:
+        db.close()
+
+def export_csv(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.name for column in columns])
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue().encode()
+
+def export_ndjson(chunks, columns):
+    names = [column.name for column in columns]
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(names, row)), default=datetime.isoformat) + "\n" for row in rows
+        ).encode()
+
+class ExportSink:
+    """Fichier en ecriture seule vide a chaque groupe de lignes Parquet"""
+    
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+    
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self.position
+    
+    def flush(self) -> None:
+        pass
+    
+    def close(self) -> None:
+        self.closed = True
+    
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def export_parquet(chunks, columns):
+    """Un groupe de lignes Parquet par lot lu en base"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    arrow_types = {Integer: pa.int64(), Float: pa.float64(), String: pa.string(), DateTime: pa.timestamp("us")}
+    schema = pa.schema([(column.name, arrow_types[type(column.type)]) for column in columns])
+    
+    sink = ExportSink()
+    with pq.ParquetWriter(sink, schema, compression="snappy") as writer:
+        for rows in chunks:
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+                schema=schema
+            ))
+            yield sink.drain()
+    yield sink.drain()
+
+EXPORT_WRITERS = {"csv": export_csv, "ndjson": export_ndjson, "parquet": export_parquet}
+
+def stream_export(export_format: str, start_date: Optional[datetime], end_date: Optional[datetime]):
+    columns = list(SensorData.__table__.columns)
+    started = time.perf_counter()
+    total = 0
+    
+    def counted_chunks():
+        nonlocal total
+        for rows in iter_export_chunks(start_date, end_date):
+            total += len(rows)
+            yield rows
+    
+    try:
+        for data in EXPORT_WRITERS[export_format](counted_chunks(), columns):
+            if data:
+                yield data
+    finally:
+        elapsed = time.perf_counter() - started
+        logger.info(f"Export {export_format} termine - {total} lignes en {elapsed:.1f} s ({total / elapsed if elapsed else 0:.0f} lignes/s)")
+
+@app.get("/data/export")
+def export_sensor_data(
+    format: str = "csv",
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """
+    Exporter les lectures d'une plage de dates en flux CSV, NDJSON ou Parquet
+    """
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Format invalide. Utilisez: {', '.join(EXPORT_MEDIA_TYPES)}")
+    
+    logger.info(f"Export {format} - Start: {start_date}, End: {end_date}")
+    
+    period = "_".join(d.strftime("%Y%m%d") for d in (start_date, end_date) if d) or "all"
+    return StreamingResponse(
+        stream_export(format, start_date, end_date),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="sensor_readings_{period}.{format}"'}
+    )
+
 @app.get("/data/stats", response_model=dict)
-async def get_system_stats(db: Session = Depends(get_db)):
+def get_system_stats(request: Request, response: Response, db: Session = Depends(get_db)):
     """
     Recuperer les statistiques du systeme
     """
     try:
         logger.info("Calcul des statistiques du systeme")
         
-        # Derniere lecture
-        latest = db.query(SensorData).order_by(SensorData.timestamp.desc()).first()
+        # Derniere lecture et nombre total de lectures (servis par le cache)
+        latest, total_readings = get_cached_latest(db, with_count=True)
         
         if not latest:
             logger.warning("Aucune donnee disponible pour les statistiques")
             return {"error": "Aucune donnee disponible"}
         
-        # Statistiques de base
-        total_readings = db.query(SensorData).count()
+        etag = f'"stats-{latest["id"]}-{total_readings}"'
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = POLL_CACHE_CONTROL
+        
+        latest = SimpleNamespace(**latest)
         
         # Energie totale consommee
         total_energy_s1 = latest.savedEnergyS1 if latest.savedEnergyS1 else 0
@@ -445,8 +1572,98 @@ async def get_system_stats(db: Session = Depends(get_db)):
         logger.error(f"Erreur lors du calcul des statistiques: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors du calcul des statistiques: {str(e)}")
 
+def energy_summary_from_readings(db: Session, start_date: Optional[datetime], end_date: Optional[datetime]) -> Optional[dict]:
+    """Agregats du rapport d'energie calcules par PostgreSQL sur sensor_readings"""
+    filters = []
+    if start_date:
+        filters.append(SensorData.timestamp >= start_date)
+    
+    if end_date:
+        filters.append(SensorData.timestamp <= end_date)
+    
+    # Agregats calcules par PostgreSQL: aucune ligne n'est chargee en memoire
+    stats = db.query(
+        func.count(SensorData.id).label("total"),
+        func.avg(SensorData.P1).filter(SensorData.P1.isnot(None), SensorData.P1 != 0).label("avg_p1"),
+        func.avg(SensorData.P2).filter(SensorData.P2.isnot(None), SensorData.P2 != 0).label("avg_p2"),
+        func.count(SensorData.id).filter(SensorData.etatS1 == "ON").label("s1_on"),
+        func.count(SensorData.id).filter(SensorData.etatS2 == "ON").label("s2_on")
+    ).filter(*filters).one()
+    
+    if not stats.total:
+        return None
+    
+    # Premiere et derniere lecture de la periode (energie cumulee)
+    boundary_columns = (SensorData.timestamp, SensorData.savedEnergyS1, SensorData.savedEnergyS2)
+    first_reading = db.query(*boundary_columns).filter(*filters).order_by(
+        SensorData.timestamp.asc(), SensorData.id.asc()
+    ).first()
+    last_reading = db.query(*boundary_columns).filter(*filters).order_by(
+        SensorData.timestamp.desc(), SensorData.id.desc()
+    ).first()
+    
+    return {
+        "total": stats.total,
+        "first_ts": first_reading.timestamp,
+        "last_ts": last_reading.timestamp,
+        "first_s1": first_reading.savedEnergyS1,
+        "first_s2": first_reading.savedEnergyS2,
+        "last_s1": last_reading.savedEnergyS1,
+        "last_s2": last_reading.savedEnergyS2,
+        "avg_p1": stats.avg_p1,
+        "avg_p2": stats.avg_p2,
+        "s1_on": stats.s1_on,
+        "s2_on": stats.s2_on
+    }
+
+def rollups_cover_period(start_date: Optional[datetime], end_date: Optional[datetime]) -> bool:
+    """Les rollups ne repondent exactement que pour des bornes alignees sur la minute"""
+    if not ROLLUPS_ENABLED:
+        return False
+    return all(
+        bound is None or rollup_bucket_start(bound, "minute") == bound
+        for bound in (start_date, end_date)
+    )
+
+def energy_summary_from_rollups(db: Session, start_date: Optional[datetime], end_date: Optional[datetime]) -> Optional[dict]:
+    """Agregats du rapport d'energie obtenus en fusionnant les buckets de sensor_rollups"""
+    if start_date is None:
+        start_date = db.query(func.min(SensorRollup.bucket_start)).filter(SensorRollup.granularity == "day").scalar()
+        if start_date is None:
+            return None
+    inclusive_end = end_date is not None
+    if end_date is None:
+        end_date = rollup_bucket_start(datetime.utcnow(), "minute") + ROLLUP_STEPS["minute"]
+    
+    rollup = load_rollup_summary(db, start_date, end_date)
+    if inclusive_end:
+        # Meme convention que energy_summary_from_readings: end_date est inclus, les rollups
+        # couvrent [start_date, end_date) et les lectures exactement a end_date sont ajoutees
+        columns = [SensorData.timestamp] + [
+            getattr(SensorData, name) for name in ROLLUP_MEASURES + ROLLUP_ENERGIES + ROLLUP_STATES
+        ]
+        for reading in db.query(*columns).filter(SensorData.timestamp == end_date).all():
+            single = rollup_from_row(reading._asdict(), "minute")
+            rollup = single if rollup is None else merge_rollup(rollup, single)
+    if not rollup or not rollup["sample_count"]:
+        return None
+    
+    return {
+        "total": rollup["sample_count"],
+        "first_ts": rollup["first_ts"],
+        "last_ts": rollup["last_ts"],
+        "first_s1": rollup["savedEnergyS1_first"],
+        "first_s2": rollup["savedEnergyS2_first"],
+        "last_s1": rollup["savedEnergyS1_last"],
+        "last_s2": rollup["savedEnergyS2_last"],
+        "avg_p1": rollup["P1_sum"] / rollup["P1_nonzero"] if rollup["P1_nonzero"] else None,
+        "avg_p2": rollup["P2_sum"] / rollup["P2_nonzero"] if rollup["P2_nonzero"] else None,
+        "s1_on": rollup["etatS1_on"],
+        "s2_on": rollup["etatS2_on"]
+    }
+
 @app.get("/data/energy-report", response_model=dict)
-async def get_energy_report(
+def get_energy_report(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     db: Session = Depends(get_db)
@@ -457,44 +1674,34 @@ async def get_energy_report(
     try:
         logger.info(f"Generation du rapport d'energie - Periode: {start_date} a  {end_date}")
         
-        query = db.query(SensorData)
-        
-        if start_date:
-            query = query.filter(SensorData.timestamp >= start_date)
-        
-        if end_date:
-            query = query.filter(SensorData.timestamp <= end_date)
-        
-        readings = query.order_by(SensorData.timestamp.asc()).all()
+        # Rollups (O(buckets)) si les bornes le permettent, sinon agregation sur les lectures brutes
+        if rollups_cover_period(start_date, end_date):
+            summary = energy_summary_from_rollups(db, start_date, end_date)
+        else:
+            summary = energy_summary_from_readings(db, start_date, end_date)
         
-        if not readings:
+        if not summary:
             logger.warning("Aucune donnee trouvee pour la periode specifiee")
             return {"error": "Aucune donnee pour la periode specifiee"}
         
         # Calcul de la consommation pour la periode
-        first_reading = readings[0]
-        last_reading = readings[-1]
-        
-        energy_consumed_s1 = last_reading.savedEnergyS1 - first_reading.savedEnergyS1
-        energy_consumed_s2 = last_reading.savedEnergyS2 - first_reading.savedEnergyS2
+        energy_consumed_s1 = (summary["last_s1"] or 0) - (summary["first_s1"] or 0)
+        energy_consumed_s2 = (summary["last_s2"] or 0) - (summary["first_s2"] or 0)
         total_energy_consumed = energy_consumed_s1 + energy_consumed_s2
         
         # Calcul des moyennes
-        avg_power_s1 = sum(r.P1 for r in readings if r.P1) / len([r for r in readings if r.P1])
-        avg_power_s2 = sum(r.P2 for r in readings if r.P2) / len([r for r in readings if r.P2])
+        avg_power_s1 = float(summary["avg_p1"] or 0)
+        avg_power_s2 = float(summary["avg_p2"] or 0)
         
         # Temps d'utilisation des sources
-        s1_active_count = len([r for r in readings if r.etatS1 == "ON"])
-        s2_active_count = len([r for r in readings if r.etatS2 == "ON"])
-        
-        s1_usage_percentage = (s1_active_count / len(readings)) * 100 if readings else 0
-        s2_usage_percentage = (s2_active_count / len(readings)) * 100 if readings else 0
+        s1_usage_percentage = (summary["s1_on"] / summary["total"]) * 100
+        s2_usage_percentage = (summary["s2_on"] / summary["total"]) * 100
         
         report = {
             "period": {
-                "start": first_reading.timestamp,
-                "end": last_reading.timestamp,
-                "duration_hours": (last_reading.timestamp - first_reading.timestamp).total_seconds() / 3600
+                "start": summary["first_ts"],
+                "end": summary["last_ts"],
+                "duration_hours": (summary["last_ts"] - summary["first_ts"]).total_seconds() / 3600
             },
             "energy_consumption": {
                 "source_1_kwh": round(energy_consumed_s1, 3),
@@ -508,53 +1715,422 @@ async def get_energy_report(
             "usage_statistics": {
                 "source_1_usage_percentage": round(s1_usage_percentage, 2),
                 "source_2_usage_percentage": round(s2_usage_percentage, 2),
-                "total_readings": len(readings)
+                "total_readings": summary["total"]
             }
         }
         
-        logger.info(f"Rapport genere - {len(readings)} lectures, Energie totale: {total_energy_consumed:.3f}kWh")
+        logger.info(f"Rapport genere - {summary['total']} lectures, Energie totale: {total_energy_consumed:.3f}kWh")
         return report
         
     except Exception as e:
         logger.error(f"Erreur lors de la generation du rapport: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la generation du rapport: {str(e)}")
 
-@app.delete("/data/cleanup")
-async def cleanup_old_data(days_to_keep: int = 30, db: Session = Depends(get_db)):
+@app.get("/data/rollups", response_model=List[dict])
+def get_rollups(
+    granularity: str = "hour",
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    limit: int = 500,
+    db: Session = Depends(get_db)
+):
     """
-    Nettoyer les anciennes donnees (garder seulement les X derniers jours)
+    Recuperer les agregats pre-calcules (minute, heure ou jour) d'une periode
     """
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Granularite invalide. Utilisez: {list(ROLLUP_GRANULARITIES)}")
+    
     try:
-        logger.info(f"Demarrage du nettoyage - Conservation de {days_to_keep} jours")
-        
-        cutoff_date = datetime.utcnow() - timedelta(days=days_to_keep)
-        
-        # Compter les enregistrements a  supprimer
-        count_to_delete = db.query(SensorData).filter(SensorData.timestamp < cutoff_date).count()
+        query = db.query(SensorRollup).filter(SensorRollup.granularity == granularity)
         
-        deleted_count = db.query(SensorData).filter(
-            SensorData.timestamp < cutoff_date
-        ).delete()
+        if start_date:
+            query = query.filter(SensorRollup.bucket_start >= rollup_bucket_start(start_date, granularity))
         
-        db.commit()
+        if end_date:
+            query = query.filter(SensorRollup.bucket_start <= end_date)
         
-        logger.info(f"Nettoyage termine - {deleted_count} enregistrements supprimes (date limite: {cutoff_date})")
+        buckets = query.order_by(SensorRollup.bucket_start.asc()).limit(limit).all()
         
-        return {
-            "status": "success",
-            "deleted_records": deleted_count,
-            "cutoff_date": cutoff_date,
-            "message": f"Donnees anterieures a  {days_to_keep} jours supprimees"
-        }
+        result = []
+        for bucket in buckets:
+            count = bucket.sample_count or 0
+            span_hours = (bucket.last_ts - bucket.first_ts).total_seconds() / 3600 if count else 0
+            item = {
+                "bucket_start": bucket.bucket_start,
+                "sample_count": count,
+                "first_ts": bucket.first_ts,
+                "last_ts": bucket.last_ts
+            }
+            for name in ROLLUP_MEASURES:
+                item[name] = {
+                    "min": getattr(bucket, f"{name}_min"),
+                    "max": getattr(bucket, f"{name}_max"),
+                    "avg": round(getattr(bucket, f"{name}_sum") / count, 3) if count else None
+                }
+            for name in ROLLUP_ENERGIES:
+                first_value = getattr(bucket, f"{name}_first")
+                last_value = getattr(bucket, f"{name}_last")
+                item[f"{name}_delta"] = round((last_value or 0) - (first_value or 0), 3)
+            for name in ROLLUP_STATES:
+                # Duree ON estimee: part des echantillons ON sur la duree couverte par le bucket
+                on_count = getattr(bucket, f"{name}_on")
+                item[f"{name}_on_hours"] = round(span_hours * on_count / count, 3) if count else 0
+            result.append(item)
+        
+        logger.info(f"Rollups recuperes - {len(result)} buckets ({granularity})")
+        return result
         
     except Exception as e:
-        db.rollback()
-        logger.error(f"Erreur lors du nettoyage des donnees: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erreur lors du nettoyage: {str(e)}")
+        logger.error(f"Erreur lors de la recuperation des rollups: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
 
-@app.get("/")
-async def root():
-    """
+# Series pour les graphiques: agregation par buckets dans PostgreSQL puis, pour la methode
+# lttb, Largest-Triangle-Three-Buckets sur ces buckets. La taille de la reponse ne depend
+# que de `points`, pas de la duree de la plage.
+SERIES_MAX_POINTS = int(os.getenv("SERIES_MAX_POINTS", "5000"))
+# Nombre de buckets pre-agreges par point retenu par LTTB
+SERIES_LTTB_OVERSAMPLE = int(os.getenv("SERIES_LTTB_OVERSAMPLE", "10"))
+SERIES_METHODS = ("lttb", "minmax")
+SERIES_FIELDS = {
+    **{name: getattr(SensorData, name) for name in (
+        "U1", "I1", "P1", "U2", "I2", "P2", "currentLamp1", "currentLamp2",
+        "powerLamp1", "powerLamp2", "savedEnergyS1", "savedEnergyS2", "savedEnergyT"
+    )},
+    "Ptotal": func.coalesce(SensorData.P1, 0) + func.coalesce(SensorData.P2, 0),
+    # Etats: part des echantillons ON dans le bucket (0 a 1)
+    **{name: case((getattr(SensorData, name) == "ON", 1.0), else_=0.0) for name in ROLLUP_STATES}
+}
+
+def load_series_buckets(db: Session, fields: List[str], start: datetime, end: datetime, buckets: int) -> list:
+    """Min/max/moyenne de chaque champ par bucket de largeur egale; x = instant moyen du bucket (ms)"""
+    epoch = extract("epoch", SensorData.timestamp)
+    start_epoch = (start - datetime(1970, 1, 1)).total_seconds()
+    width = max((end - start).total_seconds() / buckets, 1e-3)
+    bucket = func.floor((epoch - start_epoch) / width).label("bucket")
+    
+    columns = [bucket, (func.avg(epoch) * 1000).label("x")]
+    for name in fields:
+        expression = SERIES_FIELDS[name]
+        columns += [
+            func.min(expression).label(f"{name}_min"),
+            func.max(expression).label(f"{name}_max"),
+            func.avg(expression).label(f"{name}_avg")
+        ]
+    
+    return db.query(*columns).filter(
+        SensorData.timestamp >= start,
+        SensorData.timestamp < end
+    ).group_by(bucket).order_by(bucket).all()
+
+def lttb_indices(x, y, threshold: int):
+    """Indices des points retenus par Largest-Triangle-Three-Buckets (x croissant)"""
+    import numpy as np
+    
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+    
+    every = (size - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, size)
+        # Sommet moyen du bucket suivant
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected.append(a)
+    selected.append(size - 1)
+    return np.array(selected)
+
+@app.get("/data/series", response_model=dict)
+def get_series(
+    fields: str = "P1,P2",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    points: int = 500,
+    method: str = "lttb",
+    db: Session = Depends(get_db)
+):
+    """
+    Recuperer des series sous-echantillonnees (colonnes) pour les graphiques sur une plage
+    (par defaut les dernieres 24 heures). Horodatages en millisecondes epoch UTC.
+    """
+    field_names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in field_names if name not in SERIES_FIELDS]
+    if not field_names or unknown:
+        raise HTTPException(status_code=400, detail=f"Champs invalides: {unknown}. Utilisez: {list(SERIES_FIELDS)}")
+    if method not in SERIES_METHODS:
+        raise HTTPException(status_code=400, detail=f"Methode invalide. Utilisez: {list(SERIES_METHODS)}")
+    
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=1)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end doit etre posterieure a start")
+    points = max(2, min(points, SERIES_MAX_POINTS))
+    
+    try:
+        import numpy as np
+        
+        bucket_count = points * SERIES_LTTB_OVERSAMPLE if method == "lttb" else points
+        rows = load_series_buckets(db, field_names, start, end, bucket_count)
+        x = np.array([row.x for row in rows], dtype=float)
+        
+        result = {
+            "method": method,
+            "start": start,
+            "end": end,
+            "points": points,
+            "buckets": len(rows)
+        }
+        
+        if method == "minmax":
+            result["t"] = [round(value) for value in x.tolist()]
+            result["series"] = {
+                name: {
+                    stat: [getattr(row, f"{name}_{stat}") for row in rows] for stat in ("min", "max", "avg")
+                } for name in field_names
+            }
+        else:
+            series = {}
+            for name in field_names:
+                y = np.array([getattr(row, f"{name}_avg") for row in rows], dtype=float)
+                present = ~np.isnan(y)
+                field_x, field_y = x[present], y[present]
+                keep = lttb_indices(field_x, field_y, points)
+                series[name] = {
+                    "t": [round(value) for value in field_x[keep].tolist()],
+                    "y": [round(value, 4) for value in field_y[keep].tolist()]
+                }
+            result["series"] = series
+        
+        logger.info(f"Series {method} - {field_names}, {start} a {end}, {len(rows)} buckets")
+        return result
+        
+    except Exception as e:
+        logger.error(f"Erreur lors du calcul des series: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
+
+# Retention de sensor_readings: suppression de partitions entieres si la table est
+# partitionnee, puis suppression par lots bornes (une transaction par lot) du reste
+SENSOR_PARTITIONS_AHEAD = int(os.getenv("SENSOR_PARTITIONS_AHEAD", "3"))
+SENSOR_PARTITION_CHECK_S = int(os.getenv("SENSOR_PARTITION_CHECK_S", "3600"))
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "5000"))
+
+sensor_partition_task: Optional[asyncio.Task] = None
+
+def sensor_partition_start(moment: datetime) -> datetime:
+    if SENSOR_PARTITION_BY == "month":
+        return datetime(moment.year, moment.month, 1)
+    return datetime(moment.year, moment.month, moment.day)
+
+def next_sensor_partition_start(start: datetime) -> datetime:
+    if SENSOR_PARTITION_BY == "month":
+        return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
+
+def sensor_partition_format() -> str:
+    return "%Y%m" if SENSOR_PARTITION_BY == "month" else "%Y%m%d"
+
+def sensor_readings_is_partitioned(conn) -> bool:
+    return bool(conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'sensor_readings')"
+    )).scalar())
+
+def list_sensor_partitions(conn) -> List[tuple]:
+    """(nom, debut de periode) des partitions nommees sensor_readings_pAAAAMM[JJ]"""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'sensor_readings' ORDER BY c.relname"
+    )).scalars().all()
+    partitions = []
+    for name in names:
+        try:
+            partitions.append((name, datetime.strptime(name[len("sensor_readings_p"):], sensor_partition_format())))
+        except ValueError:
+            # Partition par defaut ou creee avec une autre granularite
+            continue
+    return partitions
+
+def ensure_sensor_partitions(now: Optional[datetime] = None) -> List[str]:
+    """Creer a l'avance la partition courante et les SENSOR_PARTITIONS_AHEAD suivantes"""
+    created = []
+    with engine.begin() as conn:
+        if not sensor_readings_is_partitioned(conn):
+            return created
+        # Les lectures hors des partitions creees (horodatages anciens) ne sont pas rejetees
+        conn.execute(text("CREATE TABLE IF NOT EXISTS sensor_readings_default PARTITION OF sensor_readings DEFAULT"))
+        existing = {name for name, _ in list_sensor_partitions(conn)}
+        start = sensor_partition_start(now or datetime.utcnow())
+        for _ in range(SENSOR_PARTITIONS_AHEAD + 1):
+            end = next_sensor_partition_start(start)
+            name = f"sensor_readings_p{start.strftime(sensor_partition_format())}"
+            if name not in existing:
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF sensor_readings "
+                    f"FOR VALUES FROM ('{start.isoformat(sep=' ')}') TO ('{end.isoformat(sep=' ')}')"
+                ))
+                created.append(name)
+            start = end
+    if created:
+        logger.info(f"Partitions de sensor_readings creees: {', '.join(created)}")
+    return created
+
+def drop_expired_sensor_partitions(cutoff: datetime) -> List[str]:
+    """Supprimer les partitions dont toute la periode est anterieure a cutoff"""
+    dropped = []
+    with engine.begin() as conn:
+        if not sensor_readings_is_partitioned(conn):
+            return dropped
+        for name, start in list_sensor_partitions(conn):
+            if next_sensor_partition_start(start) <= cutoff:
+                conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+    if dropped:
+        logger.info(f"Partitions de sensor_readings supprimees: {', '.join(dropped)}")
+    return dropped
+
+def purge_sensor_readings(db: Session, cutoff: datetime, batch_size: int) -> tuple:
+    """Supprimer les lectures anterieures a cutoff par lots de batch_size, retourne (supprimees, lots)"""
+    deleted = 0
+    batches = 0
+    while True:
+        batch_ids = select(SensorData.id).where(SensorData.timestamp < cutoff).limit(batch_size)
+        count = db.query(SensorData).filter(
+            SensorData.timestamp < cutoff,
+            SensorData.id.in_(batch_ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+        if count == 0:
+            break
+        deleted += count
+        batches += 1
+        logger.info(f"Nettoyage - lot {batches}: {deleted} enregistrements supprimes")
+        if count < batch_size:
+            break
+    return deleted, batches
+
+def run_sensor_cleanup(db: Session, days_to_keep: int, batch_size: int) -> dict:
+    cutoff_date = datetime.utcnow() - timedelta(days=days_to_keep)
+    
+    dropped_partitions = drop_expired_sensor_partitions(cutoff_date)
+    deleted_count, batches = purge_sensor_readings(db, cutoff_date, batch_size)
+    invalidate_latest_cache()
+    
+    logger.info(
+        f"Nettoyage termine - {len(dropped_partitions)} partitions supprimees, "
+        f"{deleted_count} enregistrements supprimes en {batches} lots (date limite: {cutoff_date})"
+    )
+    
+    return {
+        "status": "success",
+        "deleted_records": deleted_count,
+        "dropped_partitions": dropped_partitions,
+        "batches": batches,
+        "cutoff_date": cutoff_date,
+        "message": f"Donnees anterieures a  {days_to_keep} jours supprimees"
+    }
+
+async def sensor_partition_maintainer():
+    while True:
+        try:
+            await run_in_threadpool(ensure_sensor_partitions)
+        except Exception as e:
+            logger.error(f"Erreur lors de la creation des partitions: {str(e)}")
+        await asyncio.sleep(SENSOR_PARTITION_CHECK_S)
+
+@app.on_event("startup")
+async def start_sensor_partition_maintainer():
+    global sensor_partition_task
+    if SENSOR_PARTITIONED:
+        sensor_partition_task = asyncio.create_task(sensor_partition_maintainer())
+
+@app.on_event("shutdown")
+async def stop_sensor_partition_maintainer():
+    if sensor_partition_task is not None:
+        sensor_partition_task.cancel()
+
+@app.delete("/data/cleanup")
+def cleanup_old_data(days_to_keep: int = 30, batch_size: int = CLEANUP_BATCH_SIZE, db: Session = Depends(get_db)):
+    """
+    Nettoyer les anciennes donnees (garder seulement les X derniers jours)
+    """
+    if batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size doit etre superieur a 0")
+    
+    try:
+        logger.info(f"Demarrage du nettoyage - Conservation de {days_to_keep} jours")
+        return run_sensor_cleanup(db, days_to_keep, batch_size)
+        
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Erreur lors du nettoyage des donnees: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur lors du nettoyage: {str(e)}")
+
+def sensor_query_plan_statements() -> dict:
+    """Requetes representatives des endpoints de lecture sur sensor_readings"""
+    now = datetime.utcnow()
+    day_start = now - timedelta(days=1)
+    return {
+        "latest": select(SensorData).order_by(SensorData.timestamp.desc(), SensorData.id.desc()).limit(1),
+        "history_cursor": select(SensorData).where(
+            tuple_(SensorData.timestamp, SensorData.id) < tuple_(now, 2 ** 31 - 1)
+        ).order_by(SensorData.timestamp.desc(), SensorData.id.desc()).limit(51),
+        "history_range": select(SensorData).where(
+            SensorData.timestamp >= day_start, SensorData.timestamp <= now
+        ).order_by(SensorData.timestamp.desc(), SensorData.id.desc()).limit(51),
+        "energy_report": select(func.count(SensorData.id), func.avg(SensorData.P1)).where(
+            SensorData.timestamp >= day_start, SensorData.timestamp <= now
+        ),
+        "daily_energy": select(SensorData.timestamp, SensorData.powerLamp1, SensorData.etatLamp1).where(
+            SensorData.timestamp >= day_start, SensorData.timestamp < now
+        ).order_by(SensorData.timestamp.asc()),
+        "cleanup_batch": select(SensorData.id).where(SensorData.timestamp < day_start).limit(CLEANUP_BATCH_SIZE),
+        "lamp1_on_periods": select(SensorData.timestamp).where(
+            SensorData.etatLamp1 == "ON", SensorData.timestamp >= day_start
+        ),
+        "device_timestamp": select(SensorData.id).where(SensorData.device_timestamp == 0)
+    }
+
+def find_sequential_scans(plan: dict) -> List[str]:
+    """Relations sensor_readings* parcourues en Seq Scan dans un plan EXPLAIN (FORMAT JSON)"""
+    scans = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name", "").startswith("sensor_readings"):
+        scans.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scans.extend(find_sequential_scans(child))
+    return scans
+
+def check_sensor_query_plans() -> List[str]:
+    """
+    EXPLAIN de chaque requete avec enable_seqscan desactive: sur une base peu remplie le
+    planificateur prefere sinon un Seq Scan. Un Seq Scan restant signale un index manquant.
+    Retourne les noms des requetes en echec.
+    """
+    failures = []
+    with engine.connect() as conn:
+        conn.execute(text("SET enable_seqscan = off"))
+        for name, statement in sensor_query_plan_statements().items():
+            sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()[0]["Plan"]
+            scans = find_sequential_scans(plan)
+            if scans:
+                failures.append(name)
+                logger.error(f"Plan {name}: Seq Scan sur {', '.join(scans)}")
+            else:
+                logger.info(f"Plan {name}: {plan['Node Type']} - OK")
+        conn.rollback()
+    return failures
+
+@app.get("/")
+async def root():
+    """
     Point d'entree de l'API
     """
     logger.info("Acces a  l'endpoint racine de l'API")
@@ -574,50 +2150,595 @@ async def root():
         },
         "endpoints": {
             "POST /data": "Recevoir donnees des capteurs",
+            "POST /data/batch": "Recevoir un lot de donnees (JSON ou NDJSON)",
             "GET /data/latest": "Dernieres donnees",
+            "GET /stream/readings": "Flux temps reel des lectures (SSE)",
             "GET /data/history": "Historique des donnees",
+            "GET /data/export": "Export CSV/NDJSON/Parquet d'une plage de dates",
             "GET /data/stats": "Statistiques du systeme",
             "GET /data/energy-report": "Rapport d'energie",
+            "GET /data/rollups": "Agregats minute/heure/jour",
+            "GET /data/series": "Series sous-echantillonnees pour les graphiques (lttb ou minmax)",
             "DELETE /data/cleanup": "Nettoyer anciennes donnees",
-            "GET /logs": "Consulter les logs recents"
+            "GET /logs": "Consulter les logs recents (filtres level/contains/start_date/end_date, curseur since)",
+            "GET /logs/stream": "Suivre les logs en continu (SSE)",
+            "GET /control/get-commands": "Commandes en attente pour l'ESP32 (long-poll avec wait)",
+            "POST /control/ack": "Accuse de reception des commandes",
+            "GET /control/metrics": "Latences des commandes"
         }
     }
 
+LOG_READ_CHUNK_BYTES = 64 * 1024
+LOG_FOLLOW_INTERVAL_S = float(os.getenv("LOG_FOLLOW_INTERVAL_S", "1"))
+
+def parse_log_line(line: str) -> tuple:
+    """Extraire (horodatage, niveau) d'une ligne au format de log_formatter (None si absent)"""
+    parts = line.split(" - ", 3)
+    try:
+        timestamp = datetime.strptime(parts[0], "%Y-%m-%d %H:%M:%S,%f")
+    except ValueError:
+        return None, None
+    return timestamp, parts[2] if len(parts) > 2 else None
+
+def make_log_filter(level: Optional[str], contains: Optional[str], start_date: Optional[datetime], end_date: Optional[datetime]):
+    """Construire le predicat de filtrage des lignes (niveau minimal, sous-chaine, periode)"""
+    min_level = logging.getLevelName(level.upper()) if level else None
+    if min_level is not None and not isinstance(min_level, int):
+        raise HTTPException(status_code=400, detail=f"Niveau de log invalide: {level}")
+    
+    def matches(line: str) -> bool:
+        if contains and contains not in line:
+            return False
+        if min_level is None and start_date is None and end_date is None:
+            return True
+        timestamp, line_level = parse_log_line(line)
+        if min_level is not None:
+            line_severity = logging.getLevelName(line_level) if line_level else None
+            if not isinstance(line_severity, int) or line_severity < min_level:
+                return False
+        if start_date and (timestamp is None or timestamp < start_date):
+            return False
+        if end_date and (timestamp is None or timestamp > end_date):
+            return False
+        return True
+    
+    return matches
+
+def read_log_tail(path: str, lines: int, matches, stop_before: Optional[datetime] = None) -> tuple:
+    """
+    Lire les `lines` dernieres lignes correspondant au filtre en remontant le fichier par blocs
+    depuis la fin: le cout depend du nombre de lignes retournees, pas de la taille du fichier.
+    Retourne (lignes, taille du fichier lue).
+    """
+    found = []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        position = end
+        remainder = b""
+        
+        while position > 0 and len(found) < lines:
+            read_size = min(LOG_READ_CHUNK_BYTES, position)
+            position -= read_size
+            f.seek(position)
+            parts = (f.read(read_size) + remainder).split(b"\n")
+            # La premiere partie peut etre une ligne incomplete: elle est completee au bloc suivant
+            remainder = parts[0] if position > 0 else b""
+            candidates = parts[1:] if position > 0 else parts
+            
+            for raw in reversed(candidates):
+                line = raw.decode("utf-8", errors="replace").rstrip("\r")
+                if not line:
+                    continue
+                if stop_before is not None:
+                    timestamp, _ = parse_log_line(line)
+                    if timestamp is not None and timestamp < stop_before:
+                        # Fichier chronologique: les lignes plus anciennes sont hors periode
+                        position = 0
+                        break
+                if matches(line):
+                    found.append(line)
+                    if len(found) >= lines:
+                        break
+    
+    found.reverse()
+    return found, end
+
+def read_log_since(path: str, since: int, lines: int, matches) -> tuple:
+    """
+    Lire les lignes ajoutees apres l'octet `since` (curseur next_since d'un appel precedent).
+    Si le fichier est plus court que le curseur (rotation), la lecture reprend au debut.
+    Retourne (au plus `lines` dernieres lignes correspondantes, nouveau curseur).
+    """
+    found = deque(maxlen=lines)
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if since > end:
+            since = 0
+        f.seek(since)
+        position = since
+        for raw in f:
+            # Une ligne sans fin de ligne est en cours d'ecriture: elle sera lue au prochain appel
+            if not raw.endswith(b"\n"):
+                break
+            position += len(raw)
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            if line and matches(line):
+                found.append(line)
+    return list(found), position
+
 @app.get("/logs")
-async def get_recent_logs(lines: int = 50):
+def get_recent_logs(
+    lines: int = 50,
+    level: Optional[str] = None,
+    contains: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    since: Optional[int] = None
+):
     """
-    Recuperer les dernieres lignes du fichier de log
+    Recuperer les dernieres lignes du fichier de log.
+    Filtres: niveau minimal (level), sous-chaine (contains), periode (start_date/end_date).
+    since: curseur next_since d'un appel precedent pour ne lire que les nouvelles lignes.
     """
     try:
-        logger.info(f"Demande de consultation des logs - {lines} dernieres lignes")
+        logger.debug(f"Demande de consultation des logs - {lines} dernieres lignes")
         
         if not os.path.exists(LOG_FILE):
             logger.warning(f"Fichier de log {LOG_FILE} non trouve")
             return {"error": "Fichier de log non trouve"}
         
-        with open(LOG_FILE, 'r', encoding='utf-8') as f:
-            all_lines = f.readlines()
-            recent_lines = all_lines[-lines:] if len(all_lines) > lines else all_lines
+        lines = max(1, min(lines, 5000))
+        matches = make_log_filter(level, contains, start_date, end_date)
+        
+        if since is not None:
+            recent_lines, next_since = read_log_since(LOG_FILE, since, lines, matches)
+        else:
+            recent_lines, next_since = read_log_tail(LOG_FILE, lines, matches, stop_before=start_date)
         
         return {
             "log_file": LOG_FILE,
-            "total_lines": len(all_lines),
             "returned_lines": len(recent_lines),
-            "logs": [line.strip() for line in recent_lines]
+            "next_since": next_since,
+            "logs": recent_lines
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la lecture des logs: {str(e)}")
         return {"error": f"Erreur lors de la lecture des logs: {str(e)}"}
+
+@app.get("/logs/stream")
+async def follow_logs(
+    level: Optional[str] = None,
+    contains: Optional[str] = None,
+    since: Optional[int] = None
+):
+    """
+    Suivre le fichier de log en continu (Server-Sent Events, un evenement "log" par ligne)
+    """
+    matches = make_log_filter(level, contains, None, None)
+    
+    async def events():
+        position = since
+        if position is None:
+            position = os.path.getsize(LOG_FILE) if os.path.exists(LOG_FILE) else 0
+        while True:
+            if os.path.exists(LOG_FILE):
+                new_lines, position = await run_in_threadpool(read_log_since, LOG_FILE, position, 1000, matches)
+                for line in new_lines:
+                    yield f"event: log\nid: {position}\ndata: {line}\n\n"
+            await asyncio.sleep(LOG_FOLLOW_INTERVAL_S)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    
+# Canal de commandes vers les cartes ESP32.
+# Les commandes sont rangees par carte (parametre "board", "default" pour une installation a une carte):
+# pour une meme cle (lamp1, device_3...), seule la derniere commande non livree est conservee.
+# GET /control/get-commands?wait=N garde la requete ouverte jusqu'a N secondes (long-poll).
+# Avec ack=true, les commandes livrees restent en vol jusqu'a POST /control/ack et sont
+# relivrees apres COMMAND_ACK_TIMEOUT_S si aucun accuse de reception n'arrive.
+COMMAND_LONG_POLL_MAX_S = float(os.getenv("COMMAND_LONG_POLL_MAX_S", "30"))
+COMMAND_ACK_TIMEOUT_S = float(os.getenv("COMMAND_ACK_TIMEOUT_S", "10"))
+# Stockage des commandes: "memory" (un seul worker), "postgres" (table device_commands,
+# tous hotes) ou "unix" (broker local "python main.py command-broker", plusieurs workers d'un hote).
+# Une commande n'est reservee que par un seul poller; avec ack=true elle est relivree (meme id)
+# jusqu'a l'accuse de reception, l'ESP32 ignorant un id deja execute.
+COMMAND_BACKEND = os.getenv("COMMAND_BACKEND", "memory").lower()
+COMMAND_BROKER_SOCKET = os.getenv("COMMAND_BROKER_SOCKET", "/tmp/hybrid_commands.sock")
+COMMAND_RECHECK_S = float(os.getenv("COMMAND_RECHECK_S", "5"))
+
+def latency_summary(samples) -> dict:
+    """Resume (ms) d'une serie de latences en secondes"""
+    values = sorted(samples)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "avg_ms": round(sum(values) / len(values) * 1000, 1),
+        "p50_ms": round(values[len(values) // 2] * 1000, 1),
+        "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 1),
+        "max_ms": round(values[-1] * 1000, 1)
+    }
+
+class LocalCommandStore:
+    """Commandes en attente par carte, en memoire du worker"""
+    
+    def __init__(self):
+        self.pending = {}
+        self.in_flight = {}
+        self.events = {}
+        self.next_id = 1
+        self.delivery_latencies = deque(maxlen=1000)
+        self.ack_latencies = deque(maxlen=1000)
+    
+    def _event(self, board: str) -> asyncio.Event:
+        return self.events.setdefault(board, asyncio.Event())
+    
+    def _requeue_expired(self, board: str) -> None:
+        """Remettre en attente les commandes livrees sans accuse de reception a temps"""
+        now = time.time()
+        in_flight = self.in_flight.get(board, {})
+        for command_id, command in list(in_flight.items()):
+            if now - command["delivered_at"] < COMMAND_ACK_TIMEOUT_S:
+                continue
+            del in_flight[command_id]
+            pending = self.pending.setdefault(board, {})
+            if command["key"] not in pending:
+                pending[command["key"]] = command
+                logger.warning(f"Commande {command_id} sans accuse de reception - relivraison a {board}")
+    
+    async def put(self, board: str, key: str, action: str) -> dict:
+        command = {"id": self.next_id, "key": key, "action": action, "issued_at": time.time(), "delivered_at": None}
+        self.next_id += 1
+        self.pending.setdefault(board, {})[key] = command
+        self._event(board).set()
+        return command
+    
+    async def take(self, board: str, wait: float = 0, with_ack: bool = False) -> List[dict]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        
+        while True:
+            event = self._event(board)
+            event.clear()
+            self._requeue_expired(board)
+            commands = self.pending.pop(board, None)
+            if commands:
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return []
+            try:
+                await asyncio.wait_for(event.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+        
+        now = time.time()
+        for command in commands.values():
+            command["delivered_at"] = now
+            self.delivery_latencies.append(now - command["issued_at"])
+            if with_ack:
+                self.in_flight.setdefault(board, {})[command["id"]] = command
+        return list(commands.values())
+    
+    async def ack(self, board: str, ids: List[int]) -> int:
+        now = time.time()
+        in_flight = self.in_flight.get(board, {})
+        acknowledged = 0
+        for command_id in ids:
+            command = in_flight.pop(command_id, None)
+            if command is not None:
+                self.ack_latencies.append(now - command["issued_at"])
+                acknowledged += 1
+        return acknowledged
+    
+    async def start(self) -> None:
+        pass
+    
+    async def stop(self) -> None:
+        pass
+    
+    async def metrics(self) -> dict:
+        return {
+            "pending": sum(len(commands) for commands in self.pending.values()),
+            "in_flight": sum(len(commands) for commands in self.in_flight.values()),
+            "issued_to_delivered": latency_summary(self.delivery_latencies),
+            "issued_to_acknowledged": latency_summary(self.ack_latencies)
+        }
+
+def pg_put_command(board: str, key: str, action: str) -> dict:
+    """Remplacer la commande en attente de meme cle et notifier les workers en attente"""
+    db = SessionLocal()
+    try:
+        db.query(DeviceCommand).filter(
+            DeviceCommand.board == board,
+            DeviceCommand.key == key,
+            DeviceCommand.status == "pending"
+        ).update({"status": "superseded"}, synchronize_session=False)
+        
+        command = DeviceCommand(board=board, key=key, action=action, status="pending", issued_at=datetime.utcnow())
+        db.add(command)
+        db.flush()
+        db.execute(text("SELECT pg_notify(:channel, :board)"), {"channel": PostgresCommandStore.channel, "board": board})
+        db.commit()
+        return {"id": command.id, "key": key, "action": action}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def pg_take_commands(board: str, with_ack: bool) -> List[dict]:
+    """
+    Reserver atomiquement les commandes livrables d'une carte (FOR UPDATE SKIP LOCKED):
+    deux workers qui interrogent la meme carte ne peuvent pas livrer la meme commande.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        newer = aliased(DeviceCommand)
+        superseded = select(newer.id).where(
+            newer.board == DeviceCommand.board,
+            newer.key == DeviceCommand.key,
+            newer.id > DeviceCommand.id
+        ).exists()
+        
+        deliverable = select(DeviceCommand.id).where(
+            DeviceCommand.board == board,
+            or_(
+                DeviceCommand.status == "pending",
+                and_(
+                    DeviceCommand.status == "in_flight",
+                    DeviceCommand.delivered_at < now - timedelta(seconds=COMMAND_ACK_TIMEOUT_S),
+                    ~superseded
+                )
+            )
+        ).order_by(DeviceCommand.id).with_for_update(skip_locked=True)
+        
+        rows = db.execute(
+            update(DeviceCommand)
+            .where(DeviceCommand.id.in_(deliverable.scalar_subquery()))
+            .values(status="in_flight" if with_ack else "delivered", delivered_at=now)
+            .returning(DeviceCommand.id, DeviceCommand.key, DeviceCommand.action, DeviceCommand.issued_at)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+        
+        return [
+            {"id": row.id, "key": row.key, "action": row.action}
+            for row in sorted(rows, key=lambda row: row.id)
+        ]
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def pg_ack_commands(board: str, ids: List[int]) -> int:
+    db = SessionLocal()
+    try:
+        acknowledged = db.query(DeviceCommand).filter(
+            DeviceCommand.board == board,
+            DeviceCommand.id.in_(ids),
+            DeviceCommand.status == "in_flight"
+        ).update({"status": "acked", "acked_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        return acknowledged
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def pg_command_metrics() -> dict:
+    db = SessionLocal()
+    try:
+        counts = dict(db.query(DeviceCommand.status, func.count(DeviceCommand.id)).filter(
+            DeviceCommand.status.in_(["pending", "in_flight"])
+        ).group_by(DeviceCommand.status).all())
+        
+        since = datetime.utcnow() - timedelta(hours=1)
+        delivered = db.query(extract("epoch", DeviceCommand.delivered_at - DeviceCommand.issued_at)).filter(
+            DeviceCommand.delivered_at >= since
+        ).order_by(DeviceCommand.delivered_at.desc()).limit(1000).all()
+        acked = db.query(extract("epoch", DeviceCommand.acked_at - DeviceCommand.issued_at)).filter(
+            DeviceCommand.acked_at >= since
+        ).order_by(DeviceCommand.acked_at.desc()).limit(1000).all()
+        
+        return {
+            "pending": counts.get("pending", 0),
+            "in_flight": counts.get("in_flight", 0),
+            "issued_to_delivered": latency_summary(float(row[0]) for row in delivered),
+            "issued_to_acknowledged": latency_summary(float(row[0]) for row in acked)
+        }
+    finally:
+        db.close()
+
+class PostgresCommandStore:
+    """Commandes partagees par tous les workers via la table device_commands (SKIP LOCKED + LISTEN/NOTIFY)"""
+    
+    channel = "device_commands"
+    
+    def __init__(self):
+        self.events = {}
+        self.listener = None
+    
+    def _event(self, board: str) -> asyncio.Event:
+        return self.events.setdefault(board, asyncio.Event())
+    
+    def _on_notify(self) -> None:
+        self.listener.poll()
+        while self.listener.notifies:
+            notify = self.listener.notifies.pop(0)
+            event = self.events.get(notify.payload)
+            if event is not None:
+                event.set()
+    
+    async def start(self) -> None:
+        # Connexion dediee en autocommit, surveillee par la boucle d'evenements
+        self.listener = psycopg2.connect(DATABASE_URL)
+        self.listener.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.listener.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        asyncio.get_running_loop().add_reader(self.listener.fileno(), self._on_notify)
+        logger.info("Canal de commandes PostgreSQL (LISTEN/NOTIFY) actif")
+    
+    async def stop(self) -> None:
+        if self.listener is not None:
+            asyncio.get_running_loop().remove_reader(self.listener.fileno())
+            self.listener.close()
+            self.listener = None
+    
+    async def put(self, board: str, key: str, action: str) -> dict:
+        return await run_in_threadpool(pg_put_command, board, key, action)
+    
+    async def take(self, board: str, wait: float = 0, with_ack: bool = False) -> List[dict]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        
+        while True:
+            event = self._event(board)
+            event.clear()
+            commands = await run_in_threadpool(pg_take_commands, board, with_ack)
+            remaining = deadline - loop.time()
+            if commands or remaining <= 0:
+                return commands
+            # Relecture periodique: commandes a relivrer et notifications perdues (reconnexion...)
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(remaining, COMMAND_RECHECK_S))
+            except asyncio.TimeoutError:
+                pass
+    
+    async def ack(self, board: str, ids: List[int]) -> int:
+        return await run_in_threadpool(pg_ack_commands, board, ids)
+    
+    async def metrics(self) -> dict:
+        return await run_in_threadpool(pg_command_metrics)
+
+class UnixSocketCommandStore:
+    """
+    Client du broker de commandes local ("python main.py command-broker"), pour plusieurs
+    workers sur un meme hote. Le broker detient un LocalCommandStore unique: chaque commande
+    n'est remise qu'a un seul worker.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+    
+    async def _call(self, request: dict):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        try:
+            writer.write(json.dumps(request).encode() + b"\n")
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            if "error" in response:
+                raise RuntimeError(f"Broker de commandes: {response['error']}")
+            return response["result"]
+        finally:
+            writer.close()
+            await writer.wait_closed()
+    
+    async def start(self) -> None:
+        logger.info(f"Canal de commandes via le broker local {self.path}")
+    
+    async def stop(self) -> None:
+        pass
+    
+    async def put(self, board: str, key: str, action: str) -> dict:
+        return await self._call({"op": "put", "board": board, "key": key, "action": action})
+    
+    async def take(self, board: str, wait: float = 0, with_ack: bool = False) -> List[dict]:
+        return await self._call({"op": "take", "board": board, "wait": wait, "with_ack": with_ack})
+    
+    async def ack(self, board: str, ids: List[int]) -> int:
+        return await self._call({"op": "ack", "board": board, "ids": ids})
+    
+    async def metrics(self) -> dict:
+        return await self._call({"op": "metrics"})
+
+async def handle_broker_client(store: LocalCommandStore, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Traiter une requete JSON (une ligne) d'un worker"""
+    try:
+        request = json.loads(await reader.readline())
+        operation = request.pop("op")
+        
+        if operation == "take":
+            # Si le worker se deconnecte pendant l'attente, la reservation est annulee
+            # avant que les commandes ne soient retirees de la file
+            take_task = asyncio.create_task(store.take(**request))
+            closed_task = asyncio.create_task(reader.read(1))
+            done, _ = await asyncio.wait({take_task, closed_task}, return_when=asyncio.FIRST_COMPLETED)
+            if take_task not in done:
+                take_task.cancel()
+                return
+            closed_task.cancel()
+            result = take_task.result()
+        elif operation == "put":
+            result = await store.put(**request)
+        elif operation == "ack":
+            result = await store.ack(**request)
+        elif operation == "metrics":
+            result = await store.metrics()
+        else:
+            raise ValueError(f"operation inconnue: {operation}")
+        
+        writer.write(json.dumps({"result": result}).encode() + b"\n")
+    except Exception as e:
+        writer.write(json.dumps({"error": str(e)}).encode() + b"\n")
+    finally:
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+def run_command_broker(path: str) -> None:
+    """Servir un LocalCommandStore partage sur une socket Unix"""
+    store = LocalCommandStore()
+    
+    async def serve():
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(
+            lambda reader, writer: handle_broker_client(store, reader, writer),
+            path=path
+        )
+        logger.info(f"Broker de commandes en ecoute sur {path}")
+        async with server:
+            await server.serve_forever()
     
+    asyncio.run(serve())
+
+def create_command_store():
+    if COMMAND_BACKEND == "postgres":
+        return PostgresCommandStore()
+    if COMMAND_BACKEND == "unix":
+        return UnixSocketCommandStore(COMMAND_BROKER_SOCKET)
+    return LocalCommandStore()
+
+command_store = create_command_store()
+
+@app.on_event("startup")
+async def start_command_store():
+    await command_store.start()
+
+@app.on_event("shutdown")
+async def stop_command_store():
+    await command_store.stop()
+
 @app.post("/control/lamp", response_model=LampControlResponse)
 async def control_lamp(control: LampControl, db: Session = Depends(get_db)):
     """
     Contra´ler l'etat d'une lampe a  distance
     """
     try:
-        global pending_commands
-        
         logger.info(f"Commande recue - Lampe {control.lamp_id}: {control.action}")
         
         # Validation des parametres
@@ -627,9 +2748,9 @@ async def control_lamp(control: LampControl, db: Session = Depends(get_db)):
         if control.action not in ["ON", "OFF"]:
             raise HTTPException(status_code=400, detail="action doit aªtre 'ON' ou 'OFF'")
         
-        pending_commands[f"lamp{control.lamp_id}"] = control.action
+        command = await command_store.put(control.board, f"lamp{control.lamp_id}", control.action)
         
-        logger.info(f"Commande stockee - Lampe {control.lamp_id} -> {control.action}")
+        logger.info(f"Commande stockee - Lampe {control.lamp_id} -> {control.action} (ID: {command['id']}, carte: {control.board})")
         
         return LampControlResponse(
             status="success",
@@ -644,39 +2765,144 @@ async def control_lamp(control: LampControl, db: Session = Depends(get_db)):
         logger.error(f"Erreur lors du contra´le de la lampe: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
 
-pending_commands = {}
-
 @app.get("/control/get-commands")
-async def get_pending_commands():
+async def get_pending_commands(board: str = "default", wait: float = 0, ack: bool = False):
     """
-    Endpoint pour que l'ESP32 recupere les commandes en attente
+    Endpoint pour que l'ESP32 recupere les commandes en attente.
+    wait > 0: attendre jusqu'a wait secondes qu'une commande arrive (long-poll).
+    ack=true: les commandes doivent etre confirmees via POST /control/ack.
     """
-    global pending_commands
-    commands = pending_commands.copy()
-    pending_commands.clear()  
-    logger.info(f"Commandes recuperees par ESP32: {commands}")
-    return {"commands": commands}
+    wait = max(0.0, min(wait, COMMAND_LONG_POLL_MAX_S))
+    commands = await command_store.take(board, wait=wait, with_ack=ack)
+    
+    if commands:
+        logger.info(f"Commandes recuperees par ESP32 ({board}): {[(c['key'], c['action']) for c in commands]}")
+    return {
+        "commands": {command["key"]: command["action"] for command in commands},
+        "ids": {command["key"]: command["id"] for command in commands}
+    }
+
+@app.post("/control/ack")
+async def acknowledge_commands(payload: CommandAck):
+    """
+    Accuse de reception des commandes executees par l'ESP32
+    """
+    acknowledged = await command_store.ack(payload.board, payload.ids)
+    logger.info(f"Accuse de reception ({payload.board}) - {acknowledged}/{len(payload.ids)} commandes")
+    return {"status": "success", "acknowledged": acknowledged}
+
+@app.get("/control/metrics")
+async def get_command_metrics():
+    """
+    Latences de bout en bout des commandes (emission -> livraison -> accuse de reception)
+    """
+    return await command_store.metrics()
+
+# Intervalle maximal entre deux echantillons: au-dela, l'intervalle est compte comme indisponibilite
+ENERGY_MAX_GAP_SECONDS = float(os.getenv("ENERGY_MAX_GAP_SECONDS", "300"))
+
+def integrate_daily_energy(df: "pd.DataFrame", max_gap_seconds: float) -> "pd.DataFrame":
+    """
+    Calculer par jour l'energie des sources et des lampes a partir des lectures triees.
+    
+    La puissance des lampes (comptee seulement quand etatLamp* == 'ON') est integree par la
+    methode des trapezes sur les intervalles reels entre horodatages. Un intervalle est
+    attribue au jour de son premier echantillon.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    days = df["timestamp"].dt.normalize()
+    grouped = df.groupby(days)
+    
+    daily = pd.DataFrame({
+        "total_readings": grouped.size(),
+        "period_start": grouped["timestamp"].min(),
+        "period_end": grouped["timestamp"].max()
+    })
+    for source in (1, 2):
+        counter = grouped[f"savedEnergyS{source}"]
+        daily[f"source{source}_kwh"] = (counter.last().fillna(0) - counter.first().fillna(0)).clip(lower=0)
+    
+    seconds = df["timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64) / 1e9
+    dt = np.diff(seconds)
+    valid = dt <= max_gap_seconds
+    kept_dt = np.where(valid, dt, 0.0)
+    
+    intervals = {
+        "covered_hours": kept_dt / 3600,
+        "downtime_hours": np.where(valid, 0.0, dt) / 3600
+    }
+    for lamp in (1, 2):
+        on = (df[f"etatLamp{lamp}"] == "ON").to_numpy()
+        power = np.where(on, df[f"powerLamp{lamp}"].fillna(0).to_numpy(dtype=float), 0.0)
+        on = on.astype(float)
+        intervals[f"lamp{lamp}_kwh"] = (power[:-1] + power[1:]) / 2 * kept_dt / 3600 / 1000
+        intervals[f"lamp{lamp}_on_hours"] = (on[:-1] + on[1:]) / 2 * kept_dt / 3600
+    
+    per_day = pd.DataFrame(intervals, index=days.to_numpy()[:-1]).groupby(level=0).sum()
+    return daily.join(per_day).fillna(0)
+
+def daily_energy_entry(day: str, row) -> dict:
+    """Mettre en forme une ligne de integrate_daily_energy comme la reponse de /data/daily-energy"""
+    return {
+        "date": day,
+        "lamp1_energy": round(row.lamp1_kwh, 3),
+        "lamp2_energy": round(row.lamp2_kwh, 3),
+        "source1_energy": round(row.source1_kwh, 3),
+        "source2_energy": round(row.source2_kwh, 3),
+        "total_energy": round(row.source1_kwh + row.source2_kwh, 3),
+        "statistics": {
+            "total_readings": int(row.total_readings),
+            "lamp1_on_duration_hours": round(row.lamp1_on_hours, 2),
+            "lamp2_on_duration_hours": round(row.lamp2_on_hours, 2),
+            "downtime_hours": round(row.downtime_hours, 2),
+            "period_start": row.period_start.to_pydatetime(),
+            "period_end": row.period_end.to_pydatetime()
+        }
+    }
 
 @app.get("/data/daily-energy", response_model=dict)
-async def get_daily_energy(
+def get_daily_energy(
     date: str,
+    end_date: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """
     Recuperer la consommation d'energie journaliere par appareil pour une date donnee
+    (ou pour chaque jour de date a end_date inclus)
     """
     try:
-        logger.info(f"Generation du rapport d'energie journaliere pour: {date}")
-        
-        start_date = datetime.strptime(date, "%Y-%m-%d")
-        end_date = start_date.replace(hour=23, minute=59, second=59)
-        
-        readings = db.query(SensorData).filter(
-            SensorData.timestamp >= start_date,
-            SensorData.timestamp <= end_date
-        ).order_by(SensorData.timestamp.asc()).all()
-        
-        if not readings:
+        start_day = datetime.strptime(date, "%Y-%m-%d")
+        end_day = datetime.strptime(end_date, "%Y-%m-%d") if end_date else start_day
+    except ValueError:
+        logger.error(f"Format de date invalide: {date} / {end_date}")
+        raise HTTPException(status_code=400, detail=f"Format de date invalide. Utilisez YYYY-MM-DD")
+    
+    if end_day < start_day:
+        raise HTTPException(status_code=400, detail="end_date doit etre posterieure ou egale a date")
+    
+    try:
+        logger.info(f"Generation du rapport d'energie journaliere pour: {date}" + (f" a {end_date}" if end_date else ""))
+        
+        # Seules les colonnes necessaires sont lues, directement sous forme de colonnes pandas
+        query = db.query(
+            SensorData.timestamp,
+            SensorData.savedEnergyS1,
+            SensorData.savedEnergyS2,
+            SensorData.powerLamp1,
+            SensorData.powerLamp2,
+            SensorData.etatLamp1,
+            SensorData.etatLamp2
+        ).filter(
+            SensorData.timestamp >= start_day,
+            SensorData.timestamp < end_day + timedelta(days=1)
+        ).order_by(SensorData.timestamp.asc())
+        # pandas n'est importe qu'au premier rapport, pas au demarrage de l'API
+        import pandas as pd
+        df = pd.read_sql(query.statement, db.connection())
+        
+        if df.empty:
             logger.warning(f"Aucune donnee trouvee pour le {date}")
             return {
                 "error": f"Aucune donnee trouvee pour le {date}",
@@ -688,76 +2914,51 @@ async def get_daily_energy(
                 "total_energy": 0
             }
         
-        # Calcul de l'energie consommee par chaque appareil
-        first_reading = readings[0]
-        last_reading = readings[-1]
-        
-        # Energie des sources (difference entre fin et debut de journee)
-        source1_energy = max(0, (last_reading.savedEnergyS1 or 0) - (first_reading.savedEnergyS1 or 0))
-        source2_energy = max(0, (last_reading.savedEnergyS2 or 0) - (first_reading.savedEnergyS2 or 0))
+        daily = integrate_daily_energy(df, ENERGY_MAX_GAP_SECONDS)
+        days = [daily_energy_entry(day.strftime("%Y-%m-%d"), row) for day, row in zip(daily.index, daily.itertuples())]
         
-        # Estimation de l'energie des lampes basee sur la puissance moyenne et le temps d'utilisation
-        lamp1_total_power = 0
-        lamp2_total_power = 0
-        lamp1_on_duration = 0
-        lamp2_on_duration = 0
+        if end_date is None:
+            result = days[0]
+        else:
+            totals = daily.sum(numeric_only=True)
+            totals["period_start"] = daily["period_start"].min()
+            totals["period_end"] = daily["period_end"].max()
+            result = daily_energy_entry(date, totals)
+            result["end_date"] = end_date
+            result["days"] = days
         
-
-        interval_hours = 0.05  
-        
-        for reading in readings:
-            if reading.etatLamp1 == 'ON' and reading.powerLamp1:
-                lamp1_total_power += reading.powerLamp1 * interval_hours
-                lamp1_on_duration += interval_hours
-                
-            if reading.etatLamp2 == 'ON' and reading.powerLamp2:
-                lamp2_total_power += reading.powerLamp2 * interval_hours
-                lamp2_on_duration += interval_hours
-        
-        # Convertir en kWh
-        lamp1_energy = lamp1_total_power / 1000  
-        lamp2_energy = lamp2_total_power / 1000 
-        
-        total_energy = source1_energy + source2_energy
-        
-        result = {
-            "date": date,
-            "lamp1_energy": round(lamp1_energy, 3),
-            "lamp2_energy": round(lamp2_energy, 3),
-            "source1_energy": round(source1_energy, 3),
-            "source2_energy": round(source2_energy, 3),
-            "total_energy": round(total_energy, 3),
-            "statistics": {
-                "total_readings": len(readings),
-                "lamp1_on_duration_hours": round(lamp1_on_duration, 2),
-                "lamp2_on_duration_hours": round(lamp2_on_duration, 2),
-                "period_start": first_reading.timestamp,
-                "period_end": last_reading.timestamp
-            }
-        }
-        
-        logger.info(f"Energie journaliere calculee - L1: {lamp1_energy:.3f}kWh, L2: {lamp2_energy:.3f}kWh, S1: {source1_energy:.3f}kWh, S2: {source2_energy:.3f}kWh")
+        logger.info(f"Energie journaliere calculee - L1: {result['lamp1_energy']:.3f}kWh, L2: {result['lamp2_energy']:.3f}kWh, S1: {result['source1_energy']:.3f}kWh, S2: {result['source2_energy']:.3f}kWh")
         return result
         
-    except ValueError as e:
-        logger.error(f"Format de date invalide: {date}")
-        raise HTTPException(status_code=400, detail=f"Format de date invalide. Utilisez YYYY-MM-DD")
     except Exception as e:
         logger.error(f"Erreur lors du calcul de l'energie journaliere: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors du calcul de l'energie journaliere: {str(e)}")
 
 @app.get("/devices", response_model=List[DeviceResponse])
-async def get_all_devices(db: Session = Depends(get_db)):
+def get_all_devices(request: Request, db: Session = Depends(get_db)):
     """Recuperer tous les appareils"""
     try:
-        devices = db.query(Device).filter(Device.is_active == True).order_by(Device.priority, Device.name).all()
-        return devices
+        # Version de la liste: nombre d'appareils actifs et derniere modification
+        last_update, active_count = db.query(func.max(Device.updated_at), func.count(Device.id)).filter(
+            Device.is_active == True
+        ).one()
+        etag = f'"devices-{active_count}-{last_update.isoformat() if last_update else 0}"'
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        
+        devices = db.query(*(getattr(Device, name) for name in DEVICE_FIELDS)).filter(
+            Device.is_active == True
+        ).order_by(Device.priority, Device.name).all()
+        return FastJSONResponse(
+            [dict(zip(DEVICE_FIELDS, device)) for device in devices],
+            headers={"ETag": etag, "Cache-Control": POLL_CACHE_CONTROL}
+        )
     except Exception as e:
         logger.error(f"Erreur lors de la recuperation des appareils: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
 
 @app.post("/devices", response_model=DeviceResponse)
-async def create_device(device: DeviceCreate, db: Session = Depends(get_db)):
+def create_device(device: DeviceCreate, db: Session = Depends(get_db)):
     """Creer un nouvel appareil"""
     try:
         # Validation des types et priorites
@@ -786,7 +2987,7 @@ async def create_device(device: DeviceCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur lors de la creation: {str(e)}")
 
 @app.put("/devices/{device_id}", response_model=DeviceResponse)
-async def update_device(device_id: int, device: DeviceUpdate, db: Session = Depends(get_db)):
+def update_device(device_id: int, device: DeviceUpdate, db: Session = Depends(get_db)):
     """Mettre a  jour un appareil"""
     try:
         db_device = db.query(Device).filter(Device.id == device_id).first()
@@ -823,7 +3024,7 @@ async def update_device(device_id: int, device: DeviceUpdate, db: Session = Depe
         raise HTTPException(status_code=500, detail=f"Erreur lors de la mise a  jour: {str(e)}")
 
 @app.delete("/devices/{device_id}")
-async def delete_device(device_id: int, db: Session = Depends(get_db)):
+def delete_device(device_id: int, db: Session = Depends(get_db)):
     """Supprimer (desactiver) un appareil"""
     try:
         db_device = db.query(Device).filter(Device.id == device_id).first()
@@ -844,33 +3045,40 @@ async def delete_device(device_id: int, db: Session = Depends(get_db)):
         logger.error(f"Erreur lors de la suppression de l'appareil: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression: {str(e)}")
 
+def set_device_state(db: Session, device_id: int, action: str) -> Optional[str]:
+    """Mettre a jour l'etat d'un appareil en base et retourner son nom (None si introuvable)"""
+    db_device = db.query(Device).filter(Device.id == device_id).first()
+    if not db_device:
+        return None
+    
+    device_name = db_device.name
+    db_device.current_state = action
+    db_device.updated_at = datetime.utcnow()
+    db.commit()
+    return device_name
+
 @app.post("/control/device", response_model=dict)
-async def control_device(device_id: int, action: str, db: Session = Depends(get_db)):
+async def control_device(device_id: int, action: str, board: str = "default", db: Session = Depends(get_db)):
     """Contra´ler un appareil"""
     try:
         if action not in ["ON", "OFF"]:
             raise HTTPException(status_code=400, detail="action doit aªtre 'ON' ou 'OFF'")
         
-        db_device = db.query(Device).filter(Device.id == device_id).first()
-        if not db_device:
+        # Mettre a  jour l'etat dans la base de donnees (hors de la boucle d'evenements)
+        device_name = await run_in_threadpool(set_device_state, db, device_id, action)
+        if device_name is None:
             raise HTTPException(status_code=404, detail="Appareil non trouve")
         
         # Stocker la commande pour l'ESP32
-        global pending_commands
-        pending_commands[f"device_{device_id}"] = action
+        await command_store.put(board, f"device_{device_id}", action)
         
-        # Mettre a  jour l'etat dans la base de donnees
-        db_device.current_state = action
-        db_device.updated_at = datetime.utcnow()
-        db.commit()
-        
-        logger.info(f"Commande envoyee - Appareil {db_device.name} (ID: {device_id}): {action}")
+        logger.info(f"Commande envoyee - Appareil {device_name} (ID: {device_id}): {action}")
         
         return {
             "status": "success",
-            "message": f"Commande envoyee pour {db_device.name}",
+            "message": f"Commande envoyee pour {device_name}",
             "device_id": device_id,
-            "device_name": db_device.name,
+            "device_name": device_name,
             "new_state": action
         }
         
@@ -880,124 +3088,298 @@ async def control_device(device_id: int, action: str, db: Session = Depends(get_
         logger.error(f"Erreur lors du contra´le de l'appareil: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
 
-@app.post("/forecast/generate", response_model=dict)
-async def generate_forecast(db: Session = Depends(get_db)):
+# Rendu des graphiques de prevision dans un pool de processus (hors boucle d'evenements,
+# sans etat global pyplot). Les workers importent matplotlib une seule fois (initializer).
+FORECAST_RENDER_WORKERS = int(os.getenv("FORECAST_RENDER_WORKERS", "1"))
+# Miniatures de l'historique, generees une fois avec l'image complete
+FORECAST_THUMBNAIL_WIDTH = int(os.getenv("FORECAST_THUMBNAIL_WIDTH", "480"))
+FORECAST_THUMBNAIL_FORMAT = os.getenv("FORECAST_THUMBNAIL_FORMAT", "webp").lower()
+
+forecast_render_pool: Optional[ProcessPoolExecutor] = None
+# Generation en cours: les appels concurrents a /forecast/generate partagent son resultat
+forecast_generation: Optional[asyncio.Future] = None
+
+def forecast_render_context():
     """
-    Générer une nouvelle prévision solaire
+    Contexte "forkserver": les workers sont forkes depuis un serveur mono-thread, jamais depuis
+    l'API (threads du QueueListener, du pool anyio, client httpx...) dont un fork pourrait
+    heriter de verrous detenus. Le serveur ne precharge que forecast_render (sans effet de bord).
     """
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["forecast_render"])
+    return context
+
+def get_forecast_render_pool() -> ProcessPoolExecutor:
+    global forecast_render_pool
+    if forecast_render_pool is None:
+        forecast_render_pool = ProcessPoolExecutor(
+            max_workers=FORECAST_RENDER_WORKERS,
+            mp_context=forecast_render_context(),
+            initializer=forecast_render.init_renderer
+        )
+    return forecast_render_pool
+
+forecast_warm_up_task: Optional[asyncio.Task] = None
+
+async def warm_forecast_render_pool():
+    loop = asyncio.get_running_loop()
+    pool = get_forecast_render_pool()
+    await asyncio.gather(*[
+        loop.run_in_executor(pool, forecast_render.warm_up) for _ in range(FORECAST_RENDER_WORKERS)
+    ])
+    logger.info(f"Pool de rendu des previsions pret - {FORECAST_RENDER_WORKERS} processus")
+
+@app.on_event("startup")
+async def start_forecast_render_pool():
+    # matplotlib/pandas sont importes par les workers en arriere-plan: l'API repond sans attendre
+    global forecast_warm_up_task
+    if all([SOLCAST_API_KEY, SOLCAST_SITE_ID, SOLCAST_BASE_URL]):
+        forecast_warm_up_task = asyncio.create_task(warm_forecast_render_pool())
+
+@app.on_event("shutdown")
+async def stop_forecast_render_pool():
+    if forecast_render_pool is not None:
+        forecast_render_pool.shutdown(wait=False, cancel_futures=True)
+
+# Client Solcast: connexions reutilisees, cache TTL par site, stale-while-revalidate
+# et une seule requete en vol par site. La prevision ne change que toutes les 30 minutes.
+SOLCAST_CACHE_TTL_S = int(os.getenv("SOLCAST_CACHE_TTL_S", "1800"))
+SOLCAST_MAX_STALE_S = int(os.getenv("SOLCAST_MAX_STALE_S", "21600"))
+SOLCAST_TIMEOUT_S = float(os.getenv("SOLCAST_TIMEOUT_S", "30"))
+
+def load_stored_forecast() -> Optional[SimpleNamespace]:
+    """Derniere reponse Solcast brute sauvegardee (ForecastData.raw_data), pour amorcer le cache"""
+    db = SessionLocal()
     try:
-        if not all([SOLCAST_API_KEY, SOLCAST_SITE_ID, SOLCAST_BASE_URL]):
-            raise HTTPException(status_code=503, detail="Configuration Solcast manquante")
-        
-        logger.info("Génération d'une nouvelle prévision solaire")
-        
-        # Appel à l'API Solcast
-        url = f"{SOLCAST_BASE_URL}/{SOLCAST_SITE_ID}/forecasts?format=json"
-        headers = {'Authorization': f'Bearer {SOLCAST_API_KEY}'}
-        
-        response = requests.get(url, headers=headers, timeout=30)
-        
+        record = db.query(ForecastData.raw_data, ForecastData.created_at).filter(
+            ForecastData.raw_data.isnot(None)
+        ).order_by(ForecastData.created_at.desc()).first()
+        if record is None or record.created_at is None:
+            return None
+        return SimpleNamespace(data=json.loads(record.raw_data), fetched_at=record.created_at, etag=None)
+    finally:
+        db.close()
+
+class SolcastClient:
+    """Client HTTP asynchrone vers l'API Solcast avec cache par site"""
+    
+    def __init__(self):
+        self.client = None
+        self.cache = {}
+        self.inflight = {}
+    
+    async def start(self) -> None:
+        import httpx
+        self.client = httpx.AsyncClient(
+            base_url=SOLCAST_BASE_URL,
+            headers={'Authorization': f'Bearer {SOLCAST_API_KEY}'},
+            timeout=SOLCAST_TIMEOUT_S,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=2)
+        )
+    
+    async def stop(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+    
+    @staticmethod
+    def _age(entry: SimpleNamespace) -> float:
+        return (datetime.utcnow() - entry.fetched_at).total_seconds()
+    
+    async def _fetch(self, site: str) -> SimpleNamespace:
+        entry = self.cache.get(site)
+        headers = {}
+        if entry is not None and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        
+        try:
+            response = await self.client.get(f"/{site}/forecasts", params={"format": "json"}, headers=headers)
+        except Exception as e:
+            logger.error(f"Erreur de connexion Solcast: {str(e)}")
+            raise HTTPException(status_code=502, detail=f"Erreur de connexion à l'API Solcast: {str(e)}")
+        
+        if response.status_code == 304 and entry is not None:
+            entry.fetched_at = datetime.utcnow()
+            return entry
         if response.status_code != 200:
             logger.error(f"Erreur API Solcast: {response.status_code} - {response.text}")
             raise HTTPException(status_code=502, detail=f"Erreur API Solcast: {response.status_code}")
         
-        data = response.json()
-        
-        # Traitement des données
-        df_forecasts = pd.DataFrame(data['forecasts'])
-        df_forecasts['period_end'] = pd.to_datetime(df_forecasts['period_end'])
-        
-        # Conversion en kW
-        for col in ['pv_estimate', 'pv_estimate10', 'pv_estimate90']:
-            df_forecasts[col] = df_forecasts[col] / 1000
-        
-        df_forecasts.rename(columns={
-            'pv_estimate': 'forecast_median_kw',
-            'pv_estimate10': 'forecast_pessimistic_kw',
-            'pv_estimate90': 'forecast_optimistic_kw'
-        }, inplace=True)
-        
-        # Génération du graphique
-        plt.style.use('default')
-        fig, ax = plt.subplots(figsize=(16, 8))
-        
-        # Plage de confiance
-        ax.fill_between(df_forecasts['period_end'],
-                        df_forecasts['forecast_pessimistic_kw'],
-                        df_forecasts['forecast_optimistic_kw'],
-                        color='orange',
-                        alpha=0.3,
-                        label='Plage de Confiance à 80%')
-        
-        # Ligne médiane
-        ax.plot(df_forecasts['period_end'],
-                df_forecasts['forecast_median_kw'],
-                color='red',
-                linestyle='-',
-                linewidth=2,
-                label='Prédiction Médiane')
-        
-        # Formatage du graphique
-        ax.set_title('Prévision de Production Solaire', fontsize=16, fontweight='bold', pad=20)
-        ax.set_xlabel('Date et Heure', fontsize=12)
-        ax.set_ylabel('Puissance AC Prévue (kW)', fontsize=12)
-        ax.grid(True, linestyle='--', alpha=0.7)
-        ax.legend(fontsize=11)
-        
-        # Formatage des dates sur l'axe X
-        ax.xaxis.set_major_formatter(DateFormatter('%d/%m %H:%M'))
-        ax.xaxis.set_major_locator(mdates.HourLocator(interval=6))
-        plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
-        
-        plt.tight_layout()
-        
-        # Conversion de l'image en base64
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-        buffer.seek(0)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
-        plt.close(fig)
-        
-        # Sauvegarde en base de données
-        now = datetime.utcnow()
-        title = f"Prévision générée le {now.strftime('%d/%m/%Y')} à {now.strftime('%H:%M')}"
-        
+        entry = SimpleNamespace(data=response.json(), fetched_at=datetime.utcnow(), etag=response.headers.get('etag'))
+        self.cache[site] = entry
+        return entry
+    
+    def _refresh(self, site: str) -> asyncio.Task:
+        """Requete unique par site: les appels concurrents partagent la meme tache"""
+        task = self.inflight.get(site)
+        if task is None:
+            task = asyncio.create_task(self._fetch(site))
+            self.inflight[site] = task
+            task.add_done_callback(lambda t: self._refresh_done(site, t))
+        return task
+    
+    def _refresh_done(self, site: str, task: asyncio.Task) -> None:
+        self.inflight.pop(site, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Rafraichissement Solcast echoue pour {site}: {task.exception()}")
+    
+    async def get_forecasts(self, site: str) -> tuple:
+        """Retourne (reponse Solcast, source) avec source parmi cache, stored, stale, api"""
+        entry = self.cache.get(site)
+        source = "cache"
+        if entry is None and site == SOLCAST_SITE_ID:
+            entry = await run_in_threadpool(load_stored_forecast)
+            if entry is not None:
+                self.cache[site] = entry
+                source = "stored"
+        
+        if entry is not None:
+            age = self._age(entry)
+            if age < SOLCAST_CACHE_TTL_S:
+                return entry.data, source
+            if age < SOLCAST_MAX_STALE_S:
+                # Donnees perimees servies immediatement, rafraichissement en arriere-plan
+                self._refresh(site)
+                return entry.data, "stale"
+        
+        entry = await asyncio.shield(self._refresh(site))
+        return entry.data, "api"
+
+solcast_client = SolcastClient()
+
+@app.on_event("startup")
+async def start_solcast_client():
+    if all([SOLCAST_API_KEY, SOLCAST_SITE_ID, SOLCAST_BASE_URL]):
+        await solcast_client.start()
+
+@app.on_event("shutdown")
+async def stop_solcast_client():
+    await solcast_client.stop()
+
+def save_forecast_record(rendered: dict, data: dict) -> tuple:
+    """Sauvegarde en base de données, retourne (id, titre)"""
+    now = datetime.utcnow()
+    title = f"Prévision générée le {now.strftime('%d/%m/%Y')} à {now.strftime('%H:%M')}"
+    
+    db = SessionLocal()
+    try:
         forecast_record = ForecastData(
             forecast_date=now,
-            image_data=image_base64,
+            image_png=rendered["png"],
+            image_sha256=hashlib.sha256(rendered["png"]).hexdigest(),
+            thumbnail_data=rendered["thumbnail"],
+            thumbnail_sha256=hashlib.sha256(rendered["thumbnail"]).hexdigest(),
+            thumbnail_media_type=rendered["thumbnail_media_type"],
             raw_data=json.dumps(data),
             title=title
         )
-        
         db.add(forecast_record)
         db.commit()
         db.refresh(forecast_record)
+        return forecast_record.id, title
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def run_forecast_generation() -> dict:
+    """Recuperer, rendre et sauvegarder une prevision en mesurant chaque etape"""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    
+    data, source = await solcast_client.get_forecasts(SOLCAST_SITE_ID)
+    fetched = time.perf_counter()
+    
+    rendered = await loop.run_in_executor(
+        get_forecast_render_pool(), forecast_render.render_forecast,
+        data['forecasts'], FORECAST_THUMBNAIL_WIDTH, FORECAST_THUMBNAIL_FORMAT
+    )
+    render_done = time.perf_counter()
+    
+    forecast_id, title = await run_in_threadpool(save_forecast_record, rendered, data)
+    saved = time.perf_counter()
+    
+    timings = {
+        "fetch_ms": round((fetched - started) * 1000, 1),
+        **rendered["timings"],
+        "render_roundtrip_ms": round((render_done - fetched) * 1000, 1),
+        "save_ms": round((saved - render_done) * 1000, 1),
+        "total_ms": round((saved - started) * 1000, 1)
+    }
+    logger.info(f"Prévision générée et sauvegardée - ID: {forecast_id}, Source: {source}, Durées: {timings}")
+    
+    return {
+        "status": "success",
+        "message": "Prévision générée avec succès",
+        "forecast_id": forecast_id,
+        "title": title,
+        "image_url": forecast_image_url(forecast_id),
+        "thumbnail_url": forecast_thumbnail_url(forecast_id),
+        "data_points": rendered["data_points"],
+        "forecast_source": source,
+        "timings": timings
+    }
+
+@app.post("/forecast/generate", response_model=dict)
+async def generate_forecast():
+    """
+    Générer une nouvelle prévision solaire
+    """
+    global forecast_generation
+    try:
+        if not all([SOLCAST_API_KEY, SOLCAST_SITE_ID, SOLCAST_BASE_URL]):
+            raise HTTPException(status_code=503, detail="Configuration Solcast manquante")
         
-        logger.info(f"Prévision générée et sauvegardée - ID: {forecast_record.id}")
+        coalesced = forecast_generation is not None and not forecast_generation.done()
+        if coalesced:
+            logger.info("Génération de prévision déjà en cours - requête regroupée")
+        else:
+            logger.info("Génération d'une nouvelle prévision solaire")
+            forecast_generation = asyncio.ensure_future(run_forecast_generation())
         
-        return {
-            "status": "success",
-            "message": "Prévision générée avec succès",
-            "forecast_id": forecast_record.id,
-            "title": title,
-            "image_data": f"data:image/png;base64,{image_base64}",
-            "data_points": len(df_forecasts)
-        }
+        # shield: l'abandon d'un client n'annule pas la generation partagee
+        result = await asyncio.shield(forecast_generation)
+        return {**result, "coalesced": coalesced}
         
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Erreur de connexion Solcast: {str(e)}")
-        raise HTTPException(status_code=502, detail=f"Erreur de connexion à l'API Solcast: {str(e)}")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de la génération de prévision: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération: {str(e)}")
 
+FORECAST_IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def forecast_image_url(forecast_id: int) -> str:
+    return f"/forecast/{forecast_id}/image"
+
+def forecast_thumbnail_url(forecast_id: int) -> str:
+    return f"/forecast/{forecast_id}/thumbnail"
+
+def immutable_image_response(request: Request, content: bytes, sha256: str, media_type: str) -> Response:
+    """Reponse image avec ETag et cache immuable, 304 si le client a deja cette version"""
+    etag = f'"{sha256}"'
+    if etag_matches(request, etag):
+        return not_modified_response(etag, FORECAST_IMAGE_CACHE_CONTROL)
+    headers = {"ETag": etag, "Cache-Control": FORECAST_IMAGE_CACHE_CONTROL}
+    return Response(content=bytes(content), media_type=media_type, headers=headers)
+
+def decode_legacy_forecast_image(image_data: str) -> bytes:
+    """Image base64 de l'ancien format, avec ou sans prefixe data:"""
+    if image_data.startswith("data:"):
+        image_data = image_data.split(",", 1)[1]
+    return base64.b64decode(image_data)
+
 @app.get("/forecast/history", response_model=List[ForecastResponse])
-async def get_forecast_history(limit: int = 10, db: Session = Depends(get_db)):
+def get_forecast_history(limit: int = 10, db: Session = Depends(get_db)):
     """
     Récupérer l'historique des prévisions
     """
     try:
-        forecasts = db.query(ForecastData).order_by(ForecastData.created_at.desc()).limit(limit).all()
+        # Metadonnees seulement: les images sont servies par /forecast/{id}/image
+        forecasts = db.query(
+            ForecastData.id, ForecastData.created_at, ForecastData.forecast_date, ForecastData.title
+        ).order_by(ForecastData.created_at.desc()).limit(limit).all()
         
         # Convertir les données pour la réponse
         result = []
@@ -1007,7 +3389,8 @@ async def get_forecast_history(limit: int = 10, db: Session = Depends(get_db)):
                 created_at=forecast.created_at,
                 forecast_date=forecast.forecast_date,
                 title=forecast.title,
-                image_data=f"data:image/png;base64,{forecast.image_data}"
+                image_url=forecast_image_url(forecast.id),
+                thumbnail_url=forecast_thumbnail_url(forecast.id)
             ))
         
         logger.info(f"Historique des prévisions récupéré - {len(result)} enregistrements")
@@ -1017,8 +3400,95 @@ async def get_forecast_history(limit: int = 10, db: Session = Depends(get_db)):
         logger.error(f"Erreur lors de la récupération de l'historique: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
 
+@app.get("/forecast/{forecast_id}/image")
+def get_forecast_image(forecast_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Image PNG d'une prévision, immuable une fois générée
+    """
+    try:
+        forecast = db.query(
+            ForecastData.image_png, ForecastData.image_sha256, ForecastData.image_data
+        ).filter(ForecastData.id == forecast_id).first()
+        if not forecast or (forecast.image_png is None and not forecast.image_data):
+            raise HTTPException(status_code=404, detail="Prévision non trouvée")
+        
+        png = forecast.image_png
+        if png is None:
+            # Ligne pas encore migree
+            png = decode_legacy_forecast_image(forecast.image_data)
+        return immutable_image_response(
+            request, png, forecast.image_sha256 or hashlib.sha256(png).hexdigest(), "image/png"
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération de l'image: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
+
+@app.get("/forecast/{forecast_id}/thumbnail")
+def get_forecast_thumbnail(forecast_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Miniature d'une prévision pour l'historique
+    """
+    try:
+        forecast = db.query(
+            ForecastData.id, ForecastData.thumbnail_data, ForecastData.thumbnail_sha256, ForecastData.thumbnail_media_type
+        ).filter(ForecastData.id == forecast_id).first()
+        if not forecast:
+            raise HTTPException(status_code=404, detail="Prévision non trouvée")
+        
+        if forecast.thumbnail_data is None:
+            # Prevision anterieure aux miniatures: image complete en attendant migrate-forecast-images
+            return RedirectResponse(url=forecast_image_url(forecast_id), status_code=307)
+        return immutable_image_response(
+            request, forecast.thumbnail_data, forecast.thumbnail_sha256, forecast.thumbnail_media_type
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération de la miniature: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
+
+def migrate_forecast_images(batch_size: int = 50) -> int:
+    """Convertir les images base64 (image_data) en binaire (image_png) et creer les miniatures manquantes, par lots"""
+    migrated = 0
+    db = SessionLocal()
+    try:
+        while True:
+            forecasts = db.query(ForecastData).filter(
+                or_(
+                    and_(ForecastData.image_png.is_(None), ForecastData.image_data.isnot(None)),
+                    and_(ForecastData.thumbnail_data.is_(None), ForecastData.image_png.isnot(None))
+                )
+            ).order_by(ForecastData.id).limit(batch_size).all()
+            if not forecasts:
+                break
+            for forecast in forecasts:
+                if forecast.image_png is None:
+                    png = decode_legacy_forecast_image(forecast.image_data)
+                    forecast.image_png = png
+                    forecast.image_sha256 = hashlib.sha256(png).hexdigest()
+                    forecast.image_data = None
+                thumbnail, media_type = forecast_render.make_thumbnail(
+                    forecast.image_png, FORECAST_THUMBNAIL_WIDTH, FORECAST_THUMBNAIL_FORMAT
+                )
+                forecast.thumbnail_data = thumbnail
+                forecast.thumbnail_sha256 = hashlib.sha256(thumbnail).hexdigest()
+                forecast.thumbnail_media_type = media_type
+            db.commit()
+            migrated += len(forecasts)
+            logger.info(f"Migration des images de prevision - {migrated} lignes converties")
+        return migrated
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
 @app.delete("/forecast/{forecast_id}")
-async def delete_forecast(forecast_id: int, db: Session = Depends(get_db)):
+def delete_forecast(forecast_id: int, db: Session = Depends(get_db)):
     """
     Supprimer une prévision
     """
@@ -1043,9 +3513,42 @@ async def delete_forecast(forecast_id: int, db: Session = Depends(get_db)):
 async def prevision_page(request: Request):
     return templates.TemplateResponse("prevision.html", {"request": request})
 
-Base.metadata.create_all(bind=engine)
-
 if __name__ == "__main__":
-    import uvicorn
-    logger.info("Demarrage du serveur FastAPI...")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="API du Systeme de Gestion Hybride")
+    subparsers = parser.add_subparsers(dest="command")
+    backfill_parser = subparsers.add_parser("backfill-rollups", help="Recalculer les rollups depuis sensor_readings")
+    backfill_parser.add_argument("--start", type=datetime.fromisoformat, default=None)
+    backfill_parser.add_argument("--end", type=datetime.fromisoformat, default=None)
+    broker_parser = subparsers.add_parser("command-broker", help="Broker de commandes partage par les workers locaux")
+    broker_parser.add_argument("--socket", default=COMMAND_BROKER_SOCKET)
+    images_parser = subparsers.add_parser("migrate-forecast-images", help="Convertir les images de prevision base64 en binaire et creer les miniatures")
+    images_parser.add_argument("--batch-size", type=int, default=50)
+    subparsers.add_parser("migrate", help="Creer/mettre a jour le schema de la base de donnees")
+    subparsers.add_parser("check-query-plans", help="Echouer si une requete de lecture fait un Seq Scan sur sensor_readings")
+    cleanup_parser = subparsers.add_parser("cleanup", help="Supprimer les lectures anciennes (partitions puis lots)")
+    cleanup_parser.add_argument("--days", type=int, default=30)
+    cleanup_parser.add_argument("--batch-size", type=int, default=CLEANUP_BATCH_SIZE)
+    args = parser.parse_args()
+    
+    if args.command == "backfill-rollups":
+        backfill_rollups(args.start, args.end)
+    elif args.command == "command-broker":
+        run_command_broker(args.socket)
+    elif args.command == "migrate":
+        init_database()
+    elif args.command == "check-query-plans":
+        sys.exit(1 if check_sensor_query_plans() else 0)
+    elif args.command == "cleanup":
+        db = SessionLocal()
+        try:
+            run_sensor_cleanup(db, args.days, args.batch_size)
+        finally:
+            db.close()
+    elif args.command == "migrate-forecast-images":
+        migrate_forecast_images(args.batch_size)
+    else:
+        import uvicorn
+        logger.info("Demarrage du serveur FastAPI...")
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,83 @@
+"""
+Charge de nombreux tableaux de bord qui interrogent l'API en continu.
+
+Chaque spectateur simule interroge /data/latest, /data/stats et /devices a intervalle fixe,
+d'abord sans puis avec If-None-Match. Le script affiche pour chaque phase les requetes/s,
+la part de reponses 304, les octets recus, les latences p50/p95 et, si --server-pid est
+fourni, le temps CPU consomme par le processus serveur (Linux, /proc).
+
+Usage: python poll_benchmark.py --url http://localhost:8000 --viewers 200 --duration 30 [--server-pid PID]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+ENDPOINTS = ("/data/latest", "/data/stats", "/devices")
+
+
+def server_cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    # utime et stime (champs 14 et 15), en ticks d'horloge
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def viewer(client: httpx.AsyncClient, conditional: bool, interval: float, deadline: float, stats: dict):
+    etags = {}
+    while time.monotonic() < deadline:
+        for endpoint in ENDPOINTS:
+            headers = {"If-None-Match": etags[endpoint]} if conditional and endpoint in etags else {}
+            started = time.perf_counter()
+            response = await client.get(endpoint, headers=headers)
+            stats["latencies"].append(time.perf_counter() - started)
+            stats["requests"] += 1
+            stats["bytes"] += len(response.content)
+            if response.status_code == 304:
+                stats["not_modified"] += 1
+            elif "etag" in response.headers:
+                etags[endpoint] = response.headers["etag"]
+        await asyncio.sleep(interval)
+
+
+async def run_phase(args, conditional: bool) -> None:
+    stats = {"requests": 0, "not_modified": 0, "bytes": 0, "latencies": []}
+    cpu_before = server_cpu_seconds(args.server_pid) if args.server_pid else None
+    limits = httpx.Limits(max_connections=args.viewers)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*[
+            viewer(client, conditional, args.interval, deadline, stats) for _ in range(args.viewers)
+        ])
+        elapsed = time.monotonic() - started
+
+    latencies = sorted(stats["latencies"]) or [0.0]
+    label = "avec If-None-Match" if conditional else "sans If-None-Match"
+    print(f"{label}:")
+    print(f"  {stats['requests'] / elapsed:.0f} requetes/s, {stats['not_modified'] / max(stats['requests'], 1):.0%} de 304")
+    print(f"  {stats['bytes'] / 1024:.0f} Kio recus ({stats['bytes'] / max(stats['requests'], 1):.0f} o/requete)")
+    print(f"  latence p50 {statistics.median(latencies) * 1000:.1f} ms, p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+    if cpu_before is not None:
+        cpu = server_cpu_seconds(args.server_pid) - cpu_before
+        print(f"  CPU serveur {cpu:.2f} s ({cpu * 1e6 / max(stats['requests'], 1):.0f} us/requete)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Charge de polling des tableaux de bord")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--viewers", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--server-pid", type=int, default=None)
+    args = parser.parse_args()
+
+    asyncio.run(run_phase(args, conditional=False))
+    asyncio.run(run_phase(args, conditional=True))
+
+
+if __name__ == "__main__":
+    main()
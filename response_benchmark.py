@@ -0,0 +1,111 @@
+"""
+Micro-benchmark de la serialisation des endpoints interroges en continu.
+
+Compare, sur des lignes synthetiques (sans base de donnees), le chemin FastAPI par defaut
+(validation Pydantic du response_model, jsonable_encoder puis json.dumps) et le chemin
+FastJSONResponse (orjson, sans revalidation) pour /data/latest, /data/history et /devices,
+apres avoir verifie que les deux chemins produisent le meme JSON.
+
+Usage: python response_benchmark.py [--history-rows 100] [--devices 20] [--repeat 2000]
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import main
+
+
+def synthetic_reading(i: int) -> dict:
+    return {
+        "id": i,
+        "timestamp": datetime(2026, 1, 1) + timedelta(seconds=i),
+        "device_timestamp": 1_700_000_000 + i,
+        "U1": 12.6, "I1": 1.25, "P1": 15.75, "U2": 12.4, "I2": 0.8, "P2": 9.92,
+        "currentLamp1": 0.42, "currentLamp2": 0.0, "powerLamp1": 5.3, "powerLamp2": 0.0,
+        "savedEnergyS1": 1234.5 + i, "savedEnergyS2": 987.6 + i, "savedEnergyT": 2222.1 + 2 * i,
+        "etatS1": "ON", "etatS2": "OFF", "etatLamp1": "ON", "etatLamp2": "OFF",
+        "sourceActive": "S1", "chargeActive": "Lamp1"
+    }
+
+
+def synthetic_device(i: int) -> dict:
+    return {
+        "id": i, "name": f"Appareil {i}", "device_type": "lampe", "priority": "prioritaire",
+        "current_state": "ON", "power_consumption": 12.5, "is_active": True,
+        "created_at": datetime(2026, 1, 1), "updated_at": datetime(2026, 1, 2)
+    }
+
+
+def measure(label: str, pydantic_call, fast_call, repeat: int, reshape=None) -> None:
+    # Les deux chemins doivent produire le meme JSON (reshape adapte la reference au format columnar)
+    expected = json.loads(pydantic_call())
+    if reshape is not None:
+        expected = reshape(expected)
+    assert json.loads(fast_call()) == expected, f"{label}: sorties orjson et pydantic differentes"
+    pydantic_s = min(timeit.repeat(pydantic_call, number=repeat, repeat=3)) / repeat
+    fast_s = min(timeit.repeat(fast_call, number=repeat, repeat=3)) / repeat
+    print(
+        f"{label:<28} pydantic+json: {pydantic_s * 1e6:9.1f} us ({len(pydantic_call())} o)   "
+        f"orjson: {fast_s * 1e6:9.1f} us ({len(fast_call())} o)   x{pydantic_s / fast_s:.1f}"
+    )
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Serialisation des endpoints de lecture")
+    parser.add_argument("--history-rows", type=int, default=100)
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    reading_fields = main.SENSOR_READING_FIELDS
+    device_fields = main.DEVICE_FIELDS
+
+    # /data/latest: dictionnaire du cache
+    latest = synthetic_reading(1)
+    measure(
+        "/data/latest",
+        lambda: json.dumps(jsonable_encoder(main.SensorReadingResponse.model_validate(latest))).encode(),
+        lambda: main.FastJSONResponse(latest).body,
+        args.repeat
+    )
+
+    # /data/history: objets ORM (ancien chemin) contre tuples de colonnes
+    history_objects = [main.SensorData(**synthetic_reading(i)) for i in range(args.history_rows)]
+    history_rows = [tuple(row[name] for name in reading_fields)
+                    for row in map(synthetic_reading, range(args.history_rows))]
+    history_adapter = TypeAdapter(list[main.SensorReadingResponse])
+    repeat = max(1, args.repeat // 10)
+    measure(
+        f"/data/history ({args.history_rows} lignes)",
+        lambda: json.dumps(jsonable_encoder(history_adapter.validate_python(history_objects, from_attributes=True))).encode(),
+        lambda: main.FastJSONResponse([dict(zip(reading_fields, row)) for row in history_rows]).body,
+        repeat
+    )
+    measure(
+        "/data/history columnar",
+        lambda: json.dumps(jsonable_encoder(history_adapter.validate_python(history_objects, from_attributes=True))).encode(),
+        lambda: main.FastJSONResponse(
+            {name: [row[i] for row in history_rows] for i, name in enumerate(reading_fields)}
+        ).body,
+        repeat,
+        reshape=lambda records: {name: [record[name] for record in records] for name in reading_fields}
+    )
+
+    # /devices
+    device_objects = [main.Device(**synthetic_device(i)) for i in range(args.devices)]
+    device_rows = [tuple(row[name] for name in device_fields) for row in map(synthetic_device, range(args.devices))]
+    device_adapter = TypeAdapter(list[main.DeviceResponse])
+    measure(
+        f"/devices ({args.devices} appareils)",
+        lambda: json.dumps(jsonable_encoder(device_adapter.validate_python(device_objects, from_attributes=True))).encode(),
+        lambda: main.FastJSONResponse([dict(zip(device_fields, row)) for row in device_rows]).body,
+        args.repeat
+    )
+
+
+if __name__ == "__main__":
+    main_benchmark()
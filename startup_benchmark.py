@@ -0,0 +1,72 @@
+"""
+Mesure du temps d'import de main.py (demarrage a froid de l'API).
+
+Lance "python -X importtime -c 'import main'" dans un processus neuf, puis affiche
+la duree totale, les modules les plus couteux et les dependances lourdes qui ne
+devraient etre chargees qu'a la premiere prevision (matplotlib, pandas, numpy, httpx).
+
+Usage: python startup_benchmark.py [--top 15] [--max-ms 1500]
+Code de sortie 1 si une dependance lourde est importee ou si --max-ms est depasse.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+LAZY_MODULES = ("matplotlib", "pandas", "numpy", "httpx", "PIL")
+
+
+def run_importtime() -> list:
+    """Retourne [(module, self_us, cumulative_us, profondeur)] dans l'ordre d'import"""
+    env = dict(os.environ)
+    env.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "startup_benchmark.log"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"Import de main.py impossible (code {result.returncode})")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps d'import de main.py")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    entries = run_importtime()
+    total_ms = sum(self_us for _, self_us, _, _ in entries) / 1000
+    top_level = sorted((e for e in entries if e[3] <= 1), key=lambda e: e[2], reverse=True)
+
+    print(f"Temps d'import total: {total_ms:.1f} ms ({len(entries)} modules)")
+    print(f"{'cumul (ms)':>11}  module")
+    for name, _, cumulative_us, _ in top_level[:args.top]:
+        print(f"{cumulative_us / 1000:>11.1f}  {name}")
+
+    loaded = sorted({name.split(".")[0] for name, _, _, _ in entries} & set(LAZY_MODULES))
+    failed = False
+    if loaded:
+        print(f"Dependances lourdes importees au demarrage: {', '.join(loaded)}")
+        failed = True
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"Temps d'import superieur au seuil de {args.max_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
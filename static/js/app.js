@@ -1,6 +1,7 @@
 // Configuration globale
 const API_BASE_URL = 'https://smart-relay.onrender.com'; // Ajustez selon votre configuration
 const UPDATE_INTERVAL = 1000; // 3 secondes
+const REFRESH_INTERVAL = 10000; // statistiques et appareils (requêtes conditionnelles)
 
 // Variables globales pour les graphiques
 let charts = {};
@@ -15,12 +16,49 @@ let chartData = {
     status: { s1: [], s2: [], lamp1: [], lamp2: [] }
 };
 
+// Courbes sur une période: champs de /data/series pour chaque série de chartData
+const SERIES_POINTS = 500;
+const chartSeriesFields = {
+    power: { p1: 'P1', p2: 'P2', total: 'Ptotal' },
+    voltage: { u1: 'U1', u2: 'U2' },
+    current: { i1: 'I1', i2: 'I2', lamp1: 'currentLamp1', lamp2: 'currentLamp2' },
+    lampPower: { lamp1: 'powerLamp1', lamp2: 'powerLamp2' },
+    energy: { s1: 'savedEnergyS1', s2: 'savedEnergyS2', total: 'savedEnergyT' },
+    status: { s1: 'etatS1', s2: 'etatS2', lamp1: 'etatLamp1', lamp2: 'etatLamp2' }
+};
+// Nombre de points conservés par série (augmenté quand une période est chargée)
+let chartMaxPoints = 50;
+
 // Variable pour le graphique d'énergie journalière
 let dailyEnergyChart = null;
 
 // Pagination pour l'historique
 let historyCurrentPage = 0;
 const historyItemsPerPage = 20;
+// Curseur a utiliser pour charger chaque page (renvoye par l'API dans X-Next-Cursor)
+let historyCursors = [null];
+
+// Dernière réponse reçue par URL, revalidée avec If-None-Match (304 = inchangée)
+const etagCache = new Map();
+
+// GET JSON conditionnel: retourne { data, changed }
+async function fetchJsonWithETag(url) {
+    const cached = etagCache.get(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    const response = await fetch(url, { headers, cache: 'no-store' });
+    
+    if (response.status === 304 && cached) {
+        return { data: cached.data, changed: false };
+    }
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (etag) {
+        etagCache.set(url, { etag, data });
+    }
+    return { data, changed: true };
+}
 
 // Initialisation au chargement de la page
 document.addEventListener('DOMContentLoaded', function() {
@@ -37,8 +75,9 @@ document.addEventListener('DOMContentLoaded', function() {
     loadDevices(); // Ajouter cette ligne
     
     // Démarrer les mises à jour automatiques
-    setInterval(loadLatestData, UPDATE_INTERVAL);
-    setInterval(updateCharts, UPDATE_INTERVAL);
+    startReadingStream();
+    setInterval(loadSystemStats, REFRESH_INTERVAL);
+    setInterval(loadDevices, REFRESH_INTERVAL);
     
     // Event listeners pour les onglets
     document.getElementById('charts-tab').addEventListener('shown.bs.tab', function () {
@@ -88,21 +127,12 @@ function updateConnectionStatus(connected) {
 // Charger les dernières données
 async function loadLatestData() {
   try {
-      const response = await fetch(`${API_BASE_URL}/data/latest`);
-      if (!response.ok) throw new Error(`HTTP ${response.status}`);
-      
-      const data = await response.json();
-      
-      // Debug des données reçues
-      debugReceivedData(data);
-      
-      updateDashboard(data);
-      addToChartData(data);
-      updateConnectionStatus(true);
-      
-      // Mettre à jour le timestamp
-      document.getElementById('lastUpdate').textContent = 
-          `Dernière MAJ: ${new Date().toLocaleTimeString()}`;
+      const { data, changed } = await fetchJsonWithETag(`${API_BASE_URL}/data/latest`);
+      if (changed) {
+          handleLatestData(data);
+      } else {
+          updateConnectionStatus(true);
+      }
       
   } catch (error) {
       console.error('Erreur lors du chargement des données:', error);
@@ -110,12 +140,45 @@ async function loadLatestData() {
   }
 }
 
+// Appliquer une nouvelle lecture (polling ou flux temps réel)
+function handleLatestData(data) {
+    // Debug des données reçues
+    debugReceivedData(data);
+    
+    updateDashboard(data);
+    addToChartData(data);
+    updateConnectionStatus(true);
+    
+    // Mettre à jour le timestamp
+    document.getElementById('lastUpdate').textContent = 
+        `Dernière MAJ: ${new Date().toLocaleTimeString()}`;
+}
+
+// Recevoir les lectures poussées par le serveur (SSE), repli sur le polling si non supporté
+function startReadingStream() {
+    if (!window.EventSource) {
+        setInterval(loadLatestData, UPDATE_INTERVAL);
+        setInterval(updateCharts, UPDATE_INTERVAL);
+        return;
+    }
+    
+    const source = new EventSource(`${API_BASE_URL}/stream/readings`);
+    source.addEventListener('reading', function (event) {
+        handleLatestData(JSON.parse(event.data));
+        updateCharts();
+    });
+    // EventSource se reconnecte automatiquement après une erreur
+    source.onerror = function () {
+        updateConnectionStatus(false);
+    };
+}
+
 async function loadDevices() {
     try {
-        const response = await fetch(`${API_BASE_URL}/devices`);
-        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const { data, changed } = await fetchJsonWithETag(`${API_BASE_URL}/devices`);
+        if (!changed) return;
         
-        devices = await response.json();
+        devices = data;
         displayDevices();
         updateDeviceControls();
         updateDashboardDevices();
@@ -570,11 +633,10 @@ console.groupEnd();
 // Charger les statistiques système
 async function loadSystemStats() {
     try {
-        const response = await fetch(`${API_BASE_URL}/data/stats`);
-        if (!response.ok) throw new Error(`HTTP ${response.status}`);
-        
-        const stats = await response.json();
-        displaySystemStats(stats);
+        const { data: stats, changed } = await fetchJsonWithETag(`${API_BASE_URL}/data/stats`);
+        if (changed) {
+            displaySystemStats(stats);
+        }
         
     } catch (error) {
         console.error('Erreur lors du chargement des statistiques:', error);
@@ -796,7 +858,6 @@ function initializeCharts() {
 // Ajouter des données aux graphiques
 function addToChartData(data) {
     const now = Date.now();
-    const maxPoints = 50; // Limiter le nombre de points affichés
     
     // Ajouter les nouveaux points
     chartData.labels.push(now);
@@ -825,15 +886,68 @@ function addToChartData(data) {
     chartData.status.lamp2.push({ x: now, y: data.etatLamp2 === 'ON' ? 1 : 0 });
     
     // Limiter le nombre de points (garder seulement les plus récents)
-    if (chartData.labels.length > maxPoints) {
+    if (chartData.labels.length > chartMaxPoints) {
         chartData.labels.shift();
-        Object.keys(chartData).forEach(category => {
-            if (category !== 'labels') {
-                Object.keys(chartData[category]).forEach(key => {
-                    chartData[category][key].shift();
-                });
-            }
+    }
+    Object.keys(chartData).forEach(category => {
+        if (category !== 'labels') {
+            Object.keys(chartData[category]).forEach(key => {
+                const points = chartData[category][key];
+                while (points.length > chartMaxPoints) {
+                    points.shift();
+                }
+            });
+        }
+    });
+}
+
+// Charger une période sous-échantillonnée côté serveur (les lectures temps réel s'y ajoutent)
+async function loadChartSeries() {
+    const hours = parseFloat(document.getElementById('chartRange').value);
+    
+    if (!hours) {
+        // Temps réel uniquement
+        chartMaxPoints = 50;
+        Object.keys(chartSeriesFields).forEach(category => {
+            Object.keys(chartSeriesFields[category]).forEach(key => {
+                chartData[category][key] = chartData[category][key].slice(-chartMaxPoints);
+            });
         });
+        updateCharts();
+        return;
+    }
+    
+    try {
+        const end = new Date();
+        const start = new Date(end.getTime() - hours * 3600 * 1000);
+        const fields = Object.values(chartSeriesFields).flatMap(category => Object.values(category));
+        // Dates UTC sans fuseau, comme les horodatages stockés
+        const params = new URLSearchParams({
+            fields: fields.join(','),
+            start: start.toISOString().slice(0, 19),
+            end: end.toISOString().slice(0, 19),
+            points: SERIES_POINTS
+        });
+        
+        const response = await fetch(`${API_BASE_URL}/data/series?${params}`);
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        
+        const data = await response.json();
+        
+        Object.entries(chartSeriesFields).forEach(([category, keys]) => {
+            Object.entries(keys).forEach(([key, field]) => {
+                const serie = data.series[field];
+                chartData[category][key] = serie.t.map((t, i) => ({ x: t, y: serie.y[i] }));
+            });
+        });
+        chartMaxPoints = SERIES_POINTS + 50;
+        updateCharts();
+        
+        console.log(`Courbes chargées: ${hours} h, ${data.buckets} buckets`);
+        
+    } catch (error) {
+        console.error('Erreur lors du chargement des courbes:', error);
+        showError(`Erreur lors du chargement des courbes: ${error.message}`);
     }
 }
 
@@ -917,8 +1031,11 @@ async function loadHistory(page = 0) {
         const startDate = document.getElementById('historyStartDate').value;
         const endDate = document.getElementById('historyEndDate').value;
         
-        let url = `${API_BASE_URL}/data/history?limit=${historyItemsPerPage}&offset=${page * historyItemsPerPage}`;
+        if (page === 0) historyCursors = [null];
+        
+        let url = `${API_BASE_URL}/data/history?limit=${historyItemsPerPage}`;
         
+        if (historyCursors[page]) url += `&cursor=${encodeURIComponent(historyCursors[page])}`;
         if (startDate) url += `&start_date=${startDate}`;
         if (endDate) url += `&end_date=${endDate}`;
         
@@ -926,7 +1043,9 @@ async function loadHistory(page = 0) {
         if (!response.ok) throw new Error(`HTTP ${response.status}`);
         
         const history = await response.json();
-        displayHistory(history, page);
+        const nextCursor = response.headers.get('X-Next-Cursor');
+        historyCursors[page + 1] = nextCursor;
+        displayHistory(history, page, nextCursor !== null);
         
     } catch (error) {
         console.error('Erreur lors du chargement de l\'historique:', error);
@@ -935,7 +1054,7 @@ async function loadHistory(page = 0) {
 }
 
 // Afficher l'historique dans le tableau
-function displayHistory(history, page) {
+function displayHistory(history, page, hasMore) {
     const tbody = document.getElementById('historyTableBody');
     
     if (!history || history.length === 0) {
@@ -965,7 +1084,7 @@ function displayHistory(history, page) {
     `).join('');
     
     // Mettre à jour la pagination
-    updateHistoryPagination(page, history.length === historyItemsPerPage);
+    updateHistoryPagination(page, hasMore);
 }
 
 // Mettre à jour la pagination de l'historique